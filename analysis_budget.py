@@ -0,0 +1,93 @@
+"""Per-call-site analysis budgets that adapt to engine load and game phase."""
+import chess
+import chess.engine
+
+# Base budget of each call site, one value per budget mode
+DEFAULT_SITE_BUDGETS = {
+    "eval": {"depth": 16, "nodes": 400000, "time": 0.3},
+    "tutor": {"depth": 18, "nodes": 1000000, "time": 1.0},
+    "speculative": {"depth": 14, "nodes": 250000, "time": 0.3},
+    "review": {"depth": 14, "nodes": 300000, "time": 0.3},
+    # Per group of root moves; every group runs on its own engine
+    "heatmap": {"depth": 12, "nodes": 300000, "time": 0.5},
+}
+
+BUDGET_MODES = ("depth", "nodes", "time")
+
+# Depth is never reduced below this, however loaded the engines are
+MIN_DEPTH = 8
+
+# Largest number of steps a budget is deepened or reduced by
+MAX_SHIFT = 4
+
+
+class AnalysisBudget:
+    """Chooses the chess.engine.Limit for a search from its call site.
+
+    Modes:
+    - "depth": fixed depth capped by the site's time, so results are
+      comparable and latency stays bounded.
+    - "nodes": node count only; with one search thread the result is
+      reproducible, which makes it safe to cache and share.
+    - "time": wall-clock time, like the old fixed ANALYSIS_TIME_LIMIT.
+
+    In depth and time modes the budget is reduced while requests queue for an
+    engine and deepened when all engines are idle. In depth mode, endgames
+    get extra depth because they reach it faster.
+    """
+
+    def __init__(self, engine_pool, mode="depth", site_budgets=None):
+        if mode not in BUDGET_MODES:
+            raise ValueError(f"Unknown analysis budget mode: {mode} (expected one of {', '.join(BUDGET_MODES)})")
+        self.engine_pool = engine_pool
+        self.mode = mode
+        self.site_budgets = {site: dict(budget) for site, budget in DEFAULT_SITE_BUDGETS.items()}
+        for site, budget in (site_budgets or {}).items():
+            self.site_budgets.setdefault(site, {}).update(budget)
+
+    def load_shift(self):
+        """Returns how many steps to deepen (+) or reduce (-) budgets at the current load."""
+        if self.engine_pool is None or not self.engine_pool.available:
+            return 0
+        size, idle, waiting = self.engine_pool.load()
+        if waiting > 0:
+            # Roughly one step per full round of queued requests
+            return -min(MAX_SHIFT, 1 + waiting // max(1, size))
+        if idle == size:
+            return 2
+        return 0
+
+    def limit(self, site, board=None):
+        """Returns the chess.engine.Limit for a search at `site` on `board`."""
+        budget = self.site_budgets[site]
+        if self.mode == "nodes":
+            # Never load-dependent: the same position always gets the same search
+            return chess.engine.Limit(nodes=budget["nodes"])
+
+        shift = self.load_shift()
+        if self.mode == "time":
+            return chess.engine.Limit(time=budget["time"] * 2 ** (shift / 2))
+
+        if board is not None:
+            shift += _phase_shift(board)
+        depth = max(MIN_DEPTH, min(budget["depth"] + shift, budget["depth"] + MAX_SHIFT))
+        # The time cap keeps the worst case close to the site's time budget
+        time_cap = budget["time"] * (2 if shift > 0 else 1)
+        return chess.engine.Limit(depth=depth, time=time_cap)
+
+    def metrics(self):
+        return {
+            "mode": self.mode,
+            "load_shift": self.load_shift(),
+            "sites": {site: str(self.limit(site)) for site in self.site_budgets},
+        }
+
+
+def _phase_shift(board):
+    """Extra depth for simplified positions, which search much faster."""
+    pieces = chess.popcount(board.occupied)
+    if pieces <= 8:
+        return 2
+    if pieces <= 16:
+        return 1
+    return 0
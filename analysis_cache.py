@@ -0,0 +1,158 @@
+"""In-process LRU cache of engine analysis shared by all sessions."""
+import collections
+import threading
+
+import chess
+import chess.engine
+import chess.polyglot
+
+# Longest principal variation kept per line (keeps entries small)
+MAX_PV_LENGTH = 8
+
+
+def position_key(board):
+    """Returns a position-only key: Zobrist hash plus side, castling and en-passant.
+
+    Move counters and history are deliberately left out so transpositions and
+    positions revisited through undo share one cache entry.
+    """
+    ep_square = board.ep_square if board.has_legal_en_passant() else None
+    return (chess.polyglot.zobrist_hash(board), board.turn, board.clean_castling_rights(), ep_square)
+
+
+def entry_from_infos(infos):
+    """Converts `engine.analyse` infos into a compact, JSON-serialisable entry.
+
+    Scores are stored from White's perspective as centipawns or mate distance,
+    and PVs as UCI strings.
+    """
+    if not isinstance(infos, list):
+        infos = [infos]
+
+    lines = []
+    for info in infos:
+        score_obj = info.get("score")
+        if score_obj is None:
+            continue
+        white_score = score_obj.white()
+        lines.append({
+            "cp": white_score.score(),
+            "mate": white_score.mate(),
+            "pv": [move.uci() for move in info.get("pv", [])[:MAX_PV_LENGTH]],
+        })
+
+    top = infos[0] if infos else {}
+    return {
+        "depth": top.get("depth", 0),
+        "nodes": top.get("nodes", 0),
+        "multipv": len(lines),
+        "lines": lines,
+    }
+
+
+def line_score(line):
+    """Returns the White-relative chess.engine.Score of a cached line."""
+    if line.get("mate") is not None:
+        return chess.engine.Mate(line["mate"])
+    return chess.engine.Cp(line["cp"])
+
+
+def _satisfies(entry, board, multipv, min_depth):
+    """True if the entry is deep enough and has `multipv` lines, or one per legal move when there are fewer."""
+    if entry is None or entry["depth"] < min_depth:
+        return False
+    return entry["multipv"] >= multipv or entry["multipv"] >= board.legal_moves.count()
+
+
+class AnalysisCache:
+    """Thread-safe LRU of analysis entries keyed by `position_key`.
+
+    A stored entry is only replaced by a result that is at least as deep or
+    that has more lines; shallower results never overwrite deeper ones.
+
+    An optional persistent `store` (see analysis_store.py) sits underneath:
+    memory misses fall through to it and new results are written through.
+    """
+
+    def __init__(self, max_entries=50000, store=None):
+        self.max_entries = max(1, int(max_entries))
+        self.store = store
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, board, multipv=1, min_depth=0):
+        """Returns the cached entry if it has enough lines and depth, else None.
+
+        A position with fewer than `multipv` legal moves needs one line per legal move.
+        """
+        entry = self._lookup(board, multipv, min_depth)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def peek(self, board, multipv=1, min_depth=0):
+        """Like `get` but without touching hit/miss counters."""
+        return self._lookup(board, multipv, min_depth)
+
+    def _lookup(self, board, multipv, min_depth):
+        key = position_key(board)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if not _satisfies(entry, board, multipv, min_depth) and self.store is not None:
+            stored = self.store.get(board)
+            if _satisfies(stored, board, multipv, min_depth):
+                self._insert(key, stored)
+                entry = stored
+
+        return entry if _satisfies(entry, board, multipv, min_depth) else None
+
+    def put(self, board, entry):
+        """Stores an entry unless a deeper one with as many lines is already cached."""
+        if not entry["lines"]:
+            return
+        if self._insert(position_key(board), entry) and self.store is not None:
+            self.store.put(board, entry)
+
+    def _insert(self, key, entry):
+        """Inserts into memory; returns False if a deeper entry was kept instead."""
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and current["depth"] > entry["depth"] and current["multipv"] >= entry["multipv"]:
+                self._entries.move_to_end(key)
+                return False
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def metrics(self):
+        """Returns size and hit/miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "store": self.store.metrics() if self.store is not None else None,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
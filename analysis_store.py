@@ -0,0 +1,140 @@
+"""SQLite-backed analysis store that survives restarts and deploys."""
+import json
+import logging
+import queue
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    epd TEXT PRIMARY KEY,
+    depth INTEGER NOT NULL,
+    multipv INTEGER NOT NULL,
+    entry TEXT NOT NULL
+)
+"""
+
+# Keep the stored row unless the new result is at least as deep or has more lines
+UPSERT = """
+INSERT INTO {table} (epd, depth, multipv, entry) VALUES (?, ?, ?, ?)
+ON CONFLICT(epd) DO UPDATE SET depth = excluded.depth, multipv = excluded.multipv, entry = excluded.entry
+WHERE excluded.depth >= {table}.depth OR excluded.multipv > {table}.multipv
+"""
+
+
+def position_epd(board):
+    """Normalized EPD of a position: no move counters, en-passant only if legal."""
+    return board.epd(en_passant="legal")
+
+
+class AnalysisStore:
+    """Persistent key/value store of analysis entries keyed by normalized EPD.
+
+    Reads are synchronous (one connection per thread). Writes are queued and
+    committed in batches by a background writer thread so requests never wait
+    on disk. Every web worker process of a host can open the same file, which
+    makes it the analysis cache they share. Kinds of entries that must not
+    replace each other (e.g. move heatmaps) go in their own `table`.
+    """
+
+    def __init__(self, path, batch_size=200, flush_interval=1.0, table="analysis"):
+        self.path = path
+        self.table = table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._writes = queue.Queue()
+        self._closed = threading.Event()
+
+        self.reads = 0
+        self.hits = 0
+        self.written = 0
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(SCHEMA.format(table=self.table))
+        connection.commit()
+
+        self._writer = threading.Thread(target=self._write_loop, name="analysis-store-writer", daemon=True)
+        self._writer.start()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, board):
+        """Returns the stored entry for a position, or None."""
+        self.reads += 1
+        try:
+            row = self._connection().execute(f"SELECT entry FROM {self.table} WHERE epd = ?", (position_epd(board),)).fetchone()
+        except sqlite3.Error as e:
+            logger.info(f"Analysis store read failed: {e}")
+            return None
+        if row is None:
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def contains(self, epd):
+        """True if an entry is stored for the EPD."""
+        row = self._connection().execute(f"SELECT 1 FROM {self.table} WHERE epd = ?", (epd,)).fetchone()
+        return row is not None
+
+    def put(self, board, entry):
+        """Queues an entry for the next batched write."""
+        if not self._closed.is_set():
+            self._writes.put((position_epd(board), entry["depth"], entry["multipv"], json.dumps(entry, separators=(",", ":"))))
+
+    def _write_loop(self):
+        while True:
+            batch = []
+            try:
+                batch.append(self._writes.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self._writes.get_nowait())
+            except queue.Empty:
+                pass
+
+            rows = [row for row in batch if row is not None]
+            if rows:
+                try:
+                    connection = self._connection()
+                    with connection:
+                        connection.executemany(UPSERT.format(table=self.table), rows)
+                    self.written += len(rows)
+                except sqlite3.Error as e:
+                    logger.info(f"Analysis store write of {len(rows)} entries failed: {e}")
+            for _ in batch:
+                self._writes.task_done()
+
+            if self._closed.is_set() and self._writes.empty():
+                break
+
+    def flush(self):
+        """Blocks until every queued write has been committed."""
+        self._writes.join()
+
+    def close(self):
+        """Commits pending writes and stops the writer thread."""
+        self._closed.set()
+        self._writes.put(None)
+        self._writer.join(timeout=10)
+
+    def __len__(self):
+        return self._connection().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def metrics(self):
+        return {
+            "path": self.path,
+            "table": self.table,
+            "reads": self.reads,
+            "hits": self.hits,
+            "written": self.written,
+            "pending_writes": self._writes.qsize(),
+        }
@@ -0,0 +1,456 @@
+"""Pool of Stockfish processes shared by the Flask request handlers."""
+import atexit
+import collections
+import contextlib
+import logging
+import threading
+import time
+import traceback
+
+import chess.engine
+
+from engine_scheduler import EngineScheduler
+
+logger = logging.getLogger(__name__)
+
+# Errors after which an engine process is considered dead or hung
+ENGINE_FAILURES = (chess.engine.EngineTerminatedError, TimeoutError)
+
+
+class EnginePoolTimeout(Exception):
+    """Raised when no engine could be checked out before the timeout expired."""
+
+
+class EnginePool:
+    """Fixed-size pool of UCI engine processes with checkout/checkin.
+
+    Each engine is used by one request at a time. Callers borrow an engine with
+    `with pool.checkout() as engine:` and it is returned to the pool on exit.
+
+    A supervisor thread keeps the pool healthy outside the request path: it
+    pings idle engines with `isready`, retires engines that died or hung, swaps
+    in warm spares and respawns processes with exponential backoff. Requests
+    never spawn engines themselves.
+
+    Checkouts may pass an `affinity` key (the game id): the game then sticks to
+    one engine so consecutive positions reuse that engine's transposition
+    table, falling back to any free engine while the sticky one is busy.
+    Searches pass `game=pool.game_token(engine)` so python-chess only sends
+    `ucinewgame` after `new_game()`, never when an engine switches games.
+
+    Waiting checkouts are served by priority class, round-robin across
+    sessions within a class and within per-class caps (see engine_scheduler.py).
+    """
+
+    def __init__(self, path, size=2, checkout_timeout=5.0, options=None, spares=1, health_interval=5.0, max_backoff=60.0, max_affinities=10000,
+                 class_caps=None):
+        self.path = path
+        self.size = max(1, int(size))
+        self.checkout_timeout = checkout_timeout
+        self.options = dict(options or {})
+        self.spares = max(0, int(spares))
+        self.health_interval = health_interval
+        self.max_backoff = max_backoff
+        self.max_affinities = max_affinities
+        self._idle = []  # LIFO: most recently released engine is handed out first
+        self._engines = []
+        self._warm_spares = []
+        self._lock = threading.Lock()
+        self._engine_freed = threading.Condition(self._lock)
+        self._closed = False
+        self.scheduler = EngineScheduler(class_caps)
+
+        # Game affinity: game key -> sticky engine, and per-engine game tokens
+        self._affinity = collections.OrderedDict()
+        self._game_tokens = {}
+        self._searches = {"sticky": [0, 0.0], "fallback": [0, 0.0], "unbound": [0, 0.0]}
+
+        # Supervisor state
+        self._wake = threading.Event()
+        self._supervisor = None
+        self._backoff = 1.0
+        self._next_spawn = 0.0
+        self._last_error = None
+        self._last_check = None
+        self._ping_ms = {}
+
+        # Queue-wait metrics
+        self._waiting = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._restarts = 0
+        self._failures = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    # --- Lifecycle ---
+    def start(self):
+        """Spawns the engine processes and warm spares, then starts the supervisor.
+
+        Returns the number of engines in rotation.
+        """
+        for _ in range(self.size):
+            engine = self._spawn()
+            if engine is None:
+                break
+            self._engines.append(engine)
+            self._idle.append(engine)
+        if self._engines:
+            for _ in range(self.spares):
+                engine = self._spawn()
+                if engine is not None:
+                    self._warm_spares.append(engine)
+            logger.info(f"Engine pool started with {len(self._engines)}/{self.size} engines and {len(self._warm_spares)} spares from: {self.path}")
+            atexit.register(self.close)
+            self._supervisor = threading.Thread(target=self._supervise, name="engine-supervisor", daemon=True)
+            self._supervisor.start()
+        return len(self._engines)
+
+    def _spawn(self):
+        try:
+            engine = chess.engine.SimpleEngine.popen_uci(self.path)
+            if self.options:
+                engine.configure(self.options)
+            return engine
+        except chess.engine.EngineTerminatedError:
+            self._last_error = "Engine terminated unexpectedly after starting"
+            logger.info(f"ERROR: Stockfish engine terminated unexpectedly after starting.")
+            logger.info(f"Check if the executable at {self.path} is corrupted or incompatible.")
+        except Exception as e:
+            self._last_error = str(e)
+            logger.info(f"ERROR: Failed to initialize Stockfish engine: {e}")
+            logger.info(f"Traceback: {traceback.format_exc()}")
+        return None
+
+    def close(self):
+        """Quits every engine process in the pool."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            engines = self._engines + self._warm_spares
+            self._engines, self._warm_spares, self._idle = [], [], []
+            self._engine_freed.notify_all()
+        self._wake.set()
+        logger.info(f"Closing {len(engines)} Stockfish engine(s)...")
+        for engine in engines:
+            _quit(engine)
+
+    @property
+    def available(self):
+        """True if at least one engine process is in rotation."""
+        return bool(self._engines) and not self._closed
+
+    # --- Checkout / Checkin ---
+    @contextlib.contextmanager
+    def checkout(self, timeout=None, affinity=None, priority="interactive", tenant=None):
+        """Borrows an engine for the duration of the `with` block.
+
+        `priority` is the scheduler class of the search and `tenant` the session
+        it is fair-queued under (defaults to `affinity`).
+        """
+        engine, kind = self._acquire(self.checkout_timeout if timeout is None else timeout, affinity, priority,
+                                     affinity if tenant is None else tenant)
+        start = time.monotonic()
+        try:
+            yield engine
+        except ENGINE_FAILURES:
+            self._retire(engine)
+            engine = None
+            raise
+        finally:
+            self._finish(priority, time.monotonic() - start)
+            if engine is not None:
+                self._record_search(kind, time.monotonic() - start)
+                self._release(engine)
+
+    @contextlib.contextmanager
+    def try_checkout(self, affinity=None, priority="speculative"):
+        """Borrows an idle engine only if no request is waiting; yields None otherwise.
+
+        Used by low-priority background work so it never queues ahead of
+        interactive requests.
+        """
+        engine = None
+        start = time.monotonic()
+        with self._lock:
+            if self.available and self._waiting == 0 and self._idle and self.scheduler.has_room(priority):
+                engine, _ = self._take_idle(affinity)
+                self.scheduler.start(priority)
+        if engine is None:
+            yield None
+            return
+        try:
+            yield engine
+        except ENGINE_FAILURES:
+            self._retire(engine)
+            engine = None
+            raise
+        finally:
+            self._finish(priority, time.monotonic() - start)
+            if engine is not None:
+                self._release(engine)
+
+    def game_token(self, engine):
+        """Value to pass as `game=` to searches on `engine`; changes only after `new_game`."""
+        return self._game_tokens.get(id(engine), 0)
+
+    def new_game(self, affinity, new_affinity=None):
+        """Starts a new game on the sticky engine of `affinity`.
+
+        Its next search sends `ucinewgame`. The engine is handed on to
+        `new_affinity` so the new game keeps using it.
+        """
+        with self._lock:
+            engine = self._affinity.pop(affinity, None)
+            if engine is None:
+                return
+            self._game_tokens[id(engine)] = self.game_token(engine) + 1
+            if new_affinity is not None:
+                self._bind(new_affinity, engine)
+
+    def _bind(self, affinity, engine):
+        self._affinity[affinity] = engine
+        self._affinity.move_to_end(affinity)
+        while len(self._affinity) > self.max_affinities:
+            self._affinity.popitem(last=False)
+
+    def _take_idle(self, affinity):
+        """Removes an idle engine, preferring the sticky one (call with the lock held).
+
+        Returns `(engine, kind)` where kind is "sticky", "fallback" or "unbound".
+        """
+        sticky = self._affinity.get(affinity) if affinity is not None else None
+        if sticky is not None and sticky not in self._engines:
+            sticky = None  # Retired, rebind below
+        if sticky is not None and sticky in self._idle:
+            self._idle.remove(sticky)
+            self._affinity.move_to_end(affinity)
+            return sticky, "sticky"
+
+        engine = self._idle.pop()
+        if affinity is not None and sticky is None:
+            self._bind(affinity, engine)
+            return engine, "unbound"
+        return engine, "fallback" if sticky is not None else "unbound"
+
+    @property
+    def contended(self):
+        """True while at least one request is waiting for an engine."""
+        return self._waiting > 0
+
+    def load(self):
+        """Returns `(size, idle, waiting)`: engines in rotation, idle engines and queued requests."""
+        with self._lock:
+            return len(self._engines), len(self._idle), self._waiting
+
+    def _acquire(self, timeout, affinity=None, priority="interactive", tenant=None):
+        if not self.available:
+            raise EnginePoolTimeout("No engines available")
+
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._lock:
+            self._waiting += 1
+            ticket = self.scheduler.enqueue(priority, tenant)
+            try:
+                while not (self._idle and self.scheduler.next_ticket() == ticket):
+                    remaining = deadline - time.monotonic()
+                    if self._closed or not self._engines or remaining <= 0:
+                        self._timeouts += 1
+                        self.scheduler.remove(ticket)
+                        # Another waiter may be next now
+                        self._engine_freed.notify_all()
+                        raise EnginePoolTimeout(f"No engine became free within {timeout}s")
+                    self._engine_freed.wait(remaining)
+                engine, kind = self._take_idle(affinity)
+                waited = time.monotonic() - start
+                self.scheduler.grant(ticket, waited)
+                if self._idle:
+                    self._engine_freed.notify_all()
+            finally:
+                self._waiting -= 1
+
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return engine, kind
+
+    def _release(self, engine):
+        with self._lock:
+            if not self._closed:
+                self._idle.append(engine)
+                # Only the waiter the scheduler picks proceeds, the others wait again
+                self._engine_freed.notify_all()
+                return
+        _quit(engine)
+
+    def _finish(self, priority, seconds):
+        with self._lock:
+            self.scheduler.finish(priority, seconds)
+            # A class below its cap again may let a waiter proceed
+            self._engine_freed.notify_all()
+
+    def _record_search(self, kind, seconds):
+        with self._lock:
+            stats = self._searches[kind]
+            stats[0] += 1
+            stats[1] += seconds
+
+    def _retire(self, engine):
+        """Takes a dead or hung engine out of rotation and promotes a warm spare.
+
+        The process is killed here; respawning is left to the supervisor.
+        """
+        logger.info("Engine died or hung, retiring it...")
+        with self._lock:
+            self._failures += 1
+            if engine in self._engines:
+                self._engines.remove(engine)
+            self._ping_ms.pop(id(engine), None)
+            self._game_tokens.pop(id(engine), None)
+            spare = self._warm_spares.pop() if self._warm_spares else None
+            if spare is not None:
+                self._engines.append(spare)
+                self._idle.append(spare)
+                self._engine_freed.notify_all()
+        _kill(engine)
+        self._wake.set()
+
+    # --- Supervisor ---
+    def _supervise(self):
+        while not self._closed:
+            try:
+                self._check_idle_engines()
+                self._replenish()
+            except Exception as e:
+                logger.info(f"Engine supervisor error: {e}")
+            self._last_check = time.time()
+            self._wake.wait(self.health_interval)
+            self._wake.clear()
+
+    def _check_idle_engines(self):
+        """Pings each idle engine with `isready`, stepping aside if a request starts waiting."""
+        checked = []
+        try:
+            while not self._closed and not self.contended:
+                with self._lock:
+                    unchecked = [engine for engine in self._idle if engine not in checked]
+                    if not unchecked:
+                        return
+                    engine = unchecked[0]
+                    self._idle.remove(engine)
+                start = time.monotonic()
+                try:
+                    engine.ping()
+                except Exception:
+                    self._retire(engine)
+                    continue
+                self._ping_ms[id(engine)] = round(1000 * (time.monotonic() - start), 2)
+                checked.append(engine)
+        finally:
+            for engine in checked:
+                self._release(engine)
+
+    def _replenish(self):
+        """Respawns missing engines and spares, backing off while spawning fails."""
+        while not self._closed:
+            with self._lock:
+                missing_engines = self.size - len(self._engines)
+                missing_spares = self.spares - len(self._warm_spares)
+            if missing_engines <= 0 and missing_spares <= 0:
+                return
+            if time.monotonic() < self._next_spawn:
+                return
+
+            engine = self._spawn()
+            if engine is None:
+                self._next_spawn = time.monotonic() + self._backoff
+                logger.info(f"Engine restart failed, retrying in {self._backoff:.0f}s")
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+                return
+            self._backoff = 1.0
+
+            with self._lock:
+                if self._closed:
+                    engine_to_quit = engine
+                elif missing_engines > 0:
+                    self._engines.append(engine)
+                    self._restarts += 1
+                    engine_to_quit = None
+                else:
+                    self._warm_spares.append(engine)
+                    engine_to_quit = None
+            if engine_to_quit is not None:
+                _quit(engine_to_quit)
+            elif missing_engines > 0:
+                self._release(engine)
+
+    # --- Metrics ---
+    def health(self):
+        """Returns the supervisor's view of every engine for the health endpoint."""
+        with self._lock:
+            idle = list(self._idle)
+            engines = [{
+                "pid": _pid(engine),
+                "state": "idle" if engine in idle else "busy",
+                "ping_ms": self._ping_ms.get(id(engine)),
+            } for engine in self._engines]
+            return {
+                "status": "ok" if len(self._engines) == self.size else ("degraded" if self._engines else "down"),
+                "engines": engines,
+                "spares": len(self._warm_spares),
+                "expected_engines": self.size,
+                "expected_spares": self.spares,
+                "restarts": self._restarts,
+                "failures": self._failures,
+                "next_restart_in_s": round(max(0.0, self._next_spawn - time.monotonic()), 1),
+                "last_error": self._last_error,
+                "last_check": self._last_check,
+            }
+
+    def metrics(self):
+        """Returns pool size, utilisation and queue-wait statistics."""
+        with self._lock:
+            return {
+                "size": len(self._engines),
+                "spares": len(self._warm_spares),
+                "idle": len(self._idle),
+                "in_use": len(self._engines) - len(self._idle),
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "failures": self._failures,
+                "restarts": self._restarts,
+                "avg_wait_ms": round(1000 * self._wait_total / self._checkouts, 2) if self._checkouts else 0.0,
+                "max_wait_ms": round(1000 * self._wait_max, 2),
+                "classes": self.scheduler.metrics(),
+                # Search time by engine choice: sticky searches should reach depth faster
+                "affinity": {
+                    kind: {"searches": count, "avg_ms": round(1000 * total / count, 2) if count else 0.0}
+                    for kind, (count, total) in self._searches.items()
+                },
+            }
+
+
+def _pid(engine):
+    try:
+        return engine.transport.get_pid()
+    except Exception:
+        return None
+
+
+def _kill(engine):
+    try:
+        engine.close()
+    except Exception as e:
+        logger.info(f"Error killing engine: {e}")
+
+
+def _quit(engine):
+    try:
+        engine.quit()
+    except chess.engine.EngineTerminatedError:
+        logger.info("Engine already terminated.")
+    except Exception as e:
+        logger.info(f"Error closing engine: {e}")
@@ -0,0 +1,147 @@
+"""Priority classes, per-session fairness and per-class caps for engine checkouts."""
+import bisect
+import collections
+import itertools
+
+# Priority classes, highest first
+PRIORITY_CLASSES = ("interactive", "tutor", "speculative", "batch")
+
+# Priority class of each analysis call site (see analysis_budget.py)
+CALL_SITE_CLASSES = {
+    "eval": "interactive",
+    "tutor": "tutor",
+    "heatmap": "tutor",
+    "stream": "tutor",
+    "speculative": "speculative",
+    "review": "batch",
+}
+
+# Upper bounds (ms) of the queue-time and service-time histogram buckets; the last bucket is unbounded
+HISTOGRAM_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def priority_class(call_site):
+    """Returns the priority class of an analysis call site."""
+    return CALL_SITE_CLASSES.get(call_site, "interactive")
+
+
+def parse_class_caps(spec):
+    """Parses "batch=2,speculative=1" into `{"batch": 2, "speculative": 1}`."""
+    caps = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        if name not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class: {name} (expected one of {', '.join(PRIORITY_CLASSES)})")
+        caps[name] = int(value)
+    return caps
+
+
+class Histogram:
+    """Fixed-bucket latency histogram in milliseconds."""
+
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        ms = 1000 * seconds
+        self.counts[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, ms)] += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def metrics(self):
+        count = sum(self.counts)
+        labels = [f"<={bound}" for bound in HISTOGRAM_BUCKETS_MS] + [f">{HISTOGRAM_BUCKETS_MS[-1]}"]
+        return {
+            "count": count,
+            "avg_ms": round(self.total / count, 2) if count else 0.0,
+            "max_ms": round(self.max, 2),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class EngineScheduler:
+    """Decides which waiting checkout gets the next free engine.
+
+    Classes are served in strict priority order, skipping a class while it
+    runs as many searches as its cap allows. Within a class, sessions
+    (tenants) take turns round-robin, so one session's batch of searches
+    cannot hold back another session's single request.
+
+    Not thread-safe on its own: the engine pool calls it with its lock held.
+    """
+
+    def __init__(self, class_caps=None):
+        self.class_caps = dict(class_caps or {})
+        self._queues = {name: collections.OrderedDict() for name in PRIORITY_CLASSES}
+        self._running = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self._served = dict.fromkeys(PRIORITY_CLASSES, 0)
+        self._queue_time = {name: Histogram() for name in PRIORITY_CLASSES}
+        self._service_time = {name: Histogram() for name in PRIORITY_CLASSES}
+        self._tickets = itertools.count()
+
+    def enqueue(self, priority, tenant=None):
+        """Adds a waiting checkout and returns its ticket."""
+        ticket = (priority, tenant, next(self._tickets))
+        self._queues[priority].setdefault(tenant, collections.deque()).append(ticket)
+        return ticket
+
+    def remove(self, ticket):
+        """Drops a ticket that gave up waiting."""
+        priority, tenant, _ = ticket
+        tickets = self._queues[priority].get(tenant)
+        if tickets is not None and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del self._queues[priority][tenant]
+
+    def has_room(self, priority):
+        """True if a class runs fewer searches than its cap."""
+        cap = self.class_caps.get(priority)
+        return cap is None or self._running[priority] < cap
+
+    def next_ticket(self):
+        """Returns the ticket to serve next, or None if every waiting class is at its cap."""
+        for priority in PRIORITY_CLASSES:
+            queue = self._queues[priority]
+            if queue and self.has_room(priority):
+                return next(iter(queue.values()))[0]
+        return None
+
+    def grant(self, ticket, waited):
+        """Marks a ticket as served and rotates its tenant to the back of its class."""
+        priority, tenant, _ = ticket
+        queue = self._queues[priority]
+        tickets = queue[tenant]
+        tickets.popleft()
+        if tickets:
+            queue.move_to_end(tenant)
+        else:
+            del queue[tenant]
+        self.start(priority, waited)
+
+    def start(self, priority, waited=0.0):
+        """Counts a search of the class as running (also for checkouts that never queued)."""
+        self._running[priority] += 1
+        self._served[priority] += 1
+        self._queue_time[priority].record(waited)
+
+    def finish(self, priority, seconds):
+        """Counts a search of the class as finished after `seconds` of service."""
+        self._running[priority] -= 1
+        self._service_time[priority].record(seconds)
+
+    def metrics(self):
+        return {
+            name: {
+                "cap": self.class_caps.get(name),
+                "running": self._running[name],
+                "waiting": sum(len(tickets) for tickets in self._queues[name].values()),
+                "waiting_sessions": len(self._queues[name]),
+                "served": self._served[name],
+                "queue_time": self._queue_time[name].metrics(),
+                "service_time": self._service_time[name].metrics(),
+            }
+            for name in PRIORITY_CLASSES
+        }
@@ -0,0 +1,291 @@
+"""Remote engine workers: a socket server around an EnginePool and its load-balancing client.
+
+A worker serves newline-delimited JSON requests over TCP or a Unix socket:
+
+    {"op": "ping"}
+    {"op": "analyse", "fen": ..., "multipv": 3, "limit": {"depth": 16, "time": 0.3}, "affinity": ..., "priority": "interactive", "tenant": ...}
+
+and answers each with `{"ok": true, ...}` or `{"ok": false, "error": ...}`.
+Analysis results are returned as analysis cache entries (see analysis_cache.py).
+
+Run a worker with:
+
+    python engine_worker.py tcp://127.0.0.1:7001 --size 4
+"""
+import argparse
+import collections
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+
+import chess
+import chess.engine
+
+from analysis_cache import entry_from_infos
+from engine_pool import EnginePool, EnginePoolTimeout
+from eval_jobs import AnalysisCancelled
+
+logger = logging.getLogger(__name__)
+
+# Socket read timeout while a cancellable search waits for its worker's answer,
+# so a cancelled search stops waiting promptly
+RECV_POLL_INTERVAL = 0.05
+
+# Seconds a depth- or node-limited search without a time cap may take
+UNTIMED_SEARCH_TIMEOUT = 30.0
+
+# Extra seconds a search may take on top of its own time limit before the worker is given up on
+RESPONSE_MARGIN = 5.0
+
+
+class WorkerUnavailable(Exception):
+    """Raised when no engine worker could run a search."""
+
+
+def parse_address(address):
+    """Returns `(family, address)` for "tcp://host:port", "host:port" or "unix:///path"."""
+    if address.startswith("unix://"):
+        return socket.AF_UNIX, address[len("unix://"):]
+    host, _, port = address.removeprefix("tcp://").rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def limit_to_json(limit):
+    return {field: getattr(limit, field) for field in ("depth", "nodes", "time") if getattr(limit, field) is not None}
+
+
+# --- Worker side ---
+class EngineWorker:
+    """Answers worker protocol requests with searches on a local EnginePool."""
+
+    def __init__(self, engine_pool):
+        self.engine_pool = engine_pool
+
+    def handle(self, request):
+        op = request.get("op")
+        if op == "ping":
+            return {"ok": self.engine_pool.available, "pool": self.engine_pool.metrics()}
+        if op == "analyse":
+            return self.analyse(request)
+        return {"ok": False, "error": f"Unknown op: {op}"}
+
+    def analyse(self, request):
+        try:
+            board = chess.Board(request["fen"])
+            limit = chess.engine.Limit(**request["limit"])
+            with self.engine_pool.checkout(affinity=request.get("affinity"), priority=request.get("priority", "interactive"),
+                                           tenant=request.get("tenant")) as engine:
+                infos = engine.analyse(board, limit, multipv=request.get("multipv", 1),
+                                       game=self.engine_pool.game_token(engine))
+            return {"ok": True, "entry": entry_from_infos(infos)}
+        except EnginePoolTimeout as e:
+            return {"ok": False, "error": str(e), "busy": True}
+        except Exception as e:
+            logger.info(f"Worker analysis failed: {e}")
+            return {"ok": False, "error": str(e)}
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.worker.handle(json.loads(line))
+            except ValueError as e:
+                response = {"ok": False, "error": f"Bad request: {e}"}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def serve(address, engine_pool):
+    """Serves the worker protocol on `address` until interrupted."""
+    family, bind_address = parse_address(address)
+    if family == socket.AF_UNIX:
+        if os.path.exists(bind_address):
+            os.unlink(bind_address)
+        server = _UnixServer(bind_address, _RequestHandler)
+    else:
+        server = _TCPServer(bind_address, _RequestHandler)
+    server.worker = EngineWorker(engine_pool)
+    logger.info(f"Engine worker listening on {address} with {engine_pool.size} engine(s)")
+    with server:
+        server.serve_forever()
+
+
+# --- Client side ---
+class RemoteEngines:
+    """Client for a set of engine workers with load balancing, heartbeats and failover.
+
+    Each search goes to the live worker with the fewest searches in flight
+    per engine; a game (`affinity`) sticks to one worker so its transposition
+    table is reused there. A heartbeat thread pings every worker and takes
+    unreachable ones out of rotation until they answer again. A search whose
+    worker fails is retried on the next live worker.
+    """
+
+    def __init__(self, addresses, heartbeat_interval=2.0, connect_timeout=1.0, max_affinities=10000):
+        self.heartbeat_interval = heartbeat_interval
+        self.connect_timeout = connect_timeout
+        self.max_affinities = max_affinities
+        self._workers = [{"address": address, "up": False, "size": 1, "in_flight": 0, "searches": 0,
+                          "failures": 0, "ping_ms": None, "last_error": None} for address in addresses]
+        self._affinity = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self.failovers = 0
+
+    def start(self):
+        """Pings every worker once, then keeps checking them in the background. Returns the number up."""
+        self._check_workers()
+        threading.Thread(target=self._heartbeat, name="engine-worker-heartbeat", daemon=True).start()
+        return sum(worker["up"] for worker in self._workers)
+
+    def close(self):
+        self._closed.set()
+
+    @property
+    def available(self):
+        """True if at least one worker answered its last heartbeat."""
+        return any(worker["up"] for worker in self._workers)
+
+    def analyse(self, board, limit, multipv=1, affinity=None, cancel_event=None, priority="interactive", tenant=None):
+        """Runs a search on a worker and returns its analysis entry."""
+        request = {"op": "analyse", "fen": board.fen(), "multipv": multipv, "limit": limit_to_json(limit),
+                   "affinity": affinity, "priority": priority, "tenant": tenant}
+        timeout = (limit.time or UNTIMED_SEARCH_TIMEOUT) + RESPONSE_MARGIN
+        tried = []
+        while True:
+            worker = self._choose(affinity, tried)
+            if worker is None:
+                raise WorkerUnavailable("No engine worker available")
+            if tried:
+                self.failovers += 1
+            tried.append(worker)
+            try:
+                response = self._call(worker, request, timeout, cancel_event)
+            except OSError as e:
+                self._mark_down(worker, e)
+                continue
+            finally:
+                with self._lock:
+                    worker["in_flight"] -= 1
+            if response.get("ok"):
+                return response["entry"]
+            if not response.get("busy"):
+                raise RuntimeError(f"Engine worker {worker['address']}: {response.get('error')}")
+
+    def _choose(self, affinity, tried):
+        """Picks the worker for a search and counts it as in flight (None if none is left)."""
+        with self._lock:
+            candidates = [worker for worker in self._workers if worker["up"] and worker not in tried]
+            if not candidates:
+                return None
+            sticky = self._affinity.get(affinity) if affinity is not None else None
+            least_loaded = min(candidates, key=lambda worker: worker["in_flight"] / worker["size"])
+            # Stay on the game's worker unless it is already full while another one has room
+            if sticky in candidates and (sticky["in_flight"] < sticky["size"] or least_loaded["in_flight"] >= least_loaded["size"]):
+                worker = sticky
+            else:
+                worker = least_loaded
+            if affinity is not None:
+                self._affinity[affinity] = worker
+                self._affinity.move_to_end(affinity)
+                while len(self._affinity) > self.max_affinities:
+                    self._affinity.popitem(last=False)
+            worker["in_flight"] += 1
+            worker["searches"] += 1
+            return worker
+
+    def _call(self, worker, request, timeout=None, cancel_event=None):
+        """Sends one request on a fresh connection and returns the decoded response."""
+        family, address = parse_address(worker["address"])
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with socket.socket(family, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.connect_timeout)
+            sock.connect(address)
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            sock.settimeout(RECV_POLL_INTERVAL if cancel_event is not None else timeout)
+            data = b""
+            while not data.endswith(b"\n"):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise AnalysisCancelled()
+                if deadline is not None and time.monotonic() > deadline:
+                    raise TimeoutError(f"No answer from engine worker {worker['address']}")
+                try:
+                    chunk = sock.recv(65536)
+                except socket.timeout:
+                    if cancel_event is None:
+                        raise
+                    continue
+                if not chunk:
+                    raise ConnectionError(f"Engine worker {worker['address']} closed the connection")
+                data += chunk
+        return json.loads(data)
+
+    def _mark_down(self, worker, error):
+        with self._lock:
+            if worker["up"]:
+                logger.info(f"Engine worker {worker['address']} is down: {error}")
+            worker["up"] = False
+            worker["failures"] += 1
+            worker["last_error"] = str(error)
+
+    def _check_workers(self):
+        for worker in self._workers:
+            start = time.monotonic()
+            try:
+                response = self._call(worker, {"op": "ping"}, timeout=self.connect_timeout)
+            except (OSError, ValueError) as e:
+                self._mark_down(worker, e)
+                continue
+            with self._lock:
+                if not worker["up"] and response.get("ok"):
+                    logger.info(f"Engine worker {worker['address']} is up")
+                worker["up"] = bool(response.get("ok"))
+                worker["size"] = max(1, response.get("pool", {}).get("size", 1))
+                worker["ping_ms"] = round(1000 * (time.monotonic() - start), 2)
+
+    def _heartbeat(self):
+        while not self._closed.wait(self.heartbeat_interval):
+            self._check_workers()
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "workers": [{key: worker[key] for key in ("address", "up", "size", "in_flight", "searches", "failures", "ping_ms", "last_error")}
+                            for worker in self._workers],
+                "up": sum(worker["up"] for worker in self._workers),
+                "failovers": self.failovers,
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve Stockfish analysis to the Chess Tutor web tier.")
+    parser.add_argument("address", help="tcp://host:port or unix:///path/to/socket")
+    parser.add_argument("--stockfish", default=os.environ.get("STOCKFISH_PATH", "./engine/stockfish/stockfish/stockfish-ubuntu-x86-64-avx2"))
+    parser.add_argument("--size", type=int, default=os.cpu_count() or 1, help="Stockfish processes in this worker")
+    parser.add_argument("--hash", type=int, default=int(os.environ.get("ENGINE_HASH_MB", 64)), help="Transposition table size per engine (MB)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    pool = EnginePool(args.stockfish, size=args.size, options={"Hash": args.hash, "Threads": 1})
+    if not pool.start():
+        raise SystemExit(f"No Stockfish engine could be started from: {args.stockfish}")
+    try:
+        serve(args.address, pool)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.close()
@@ -0,0 +1,117 @@
+"""Background evaluation jobs so routes can answer before Stockfish finishes."""
+import collections
+import concurrent.futures
+import logging
+import threading
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisCancelled(Exception):
+    """Raised inside a job whose position was superseded by a newer one."""
+
+
+class EvalJobQueue:
+    """Runs evaluation jobs on a thread pool, at most one live job per game.
+
+    Submitting a job for a game cancels that game's previous job: a queued job
+    never starts, and a running one sees its cancel event set and is expected
+    to stop its search and raise `AnalysisCancelled`.
+
+    `on_status(job_id, game_id, status, result)` is called on every status
+    change (the result only once done), e.g. to publish jobs to other processes.
+    """
+
+    def __init__(self, max_workers=2, max_jobs=10000, on_status=None):
+        self.max_jobs = max_jobs
+        self.on_status = on_status
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="eval-job")
+        self._jobs = collections.OrderedDict()
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def submit(self, game_id, fn, *args):
+        """Queues `fn(cancel_event, *args)` for a game and returns the new job id."""
+        job_id = uuid.uuid4().hex
+        cancel_event = threading.Event()
+        job = {"job_id": job_id, "game_id": game_id, "status": "pending", "result": None, "cancel": cancel_event}
+
+        with self._lock:
+            previous = self._jobs.get(self._latest.get(game_id))
+            if previous is not None:
+                self._cancel(previous)
+            self._jobs[job_id] = job
+            self._latest[game_id] = job_id
+            self._evict()
+        self._notify(job)
+
+        job["future"] = self._executor.submit(self._run, job, fn, args)
+        return job_id
+
+    def cancel_game(self, game_id):
+        """Cancels the live job of a game, if any."""
+        with self._lock:
+            job = self._jobs.get(self._latest.pop(game_id, None))
+            if job is not None:
+                self._cancel(job)
+
+    def _cancel(self, job):
+        job["cancel"].set()
+        if job["status"] == "pending":
+            self._set_status(job, "cancelled")
+
+    def _run(self, job, fn, args):
+        if job["cancel"].is_set():
+            return
+        self._set_status(job, "running")
+        try:
+            job["result"] = fn(job["cancel"], *args)
+            self._set_status(job, "cancelled" if job["cancel"].is_set() else "done")
+        except AnalysisCancelled:
+            self._set_status(job, "cancelled")
+        except Exception as e:
+            logger.info(f"Evaluation job {job['job_id']} failed: {e}")
+            self._set_status(job, "failed")
+
+    def _set_status(self, job, status):
+        job["status"] = status
+        self._notify(job)
+
+    def _notify(self, job):
+        if self.on_status is None:
+            return
+        try:
+            self.on_status(job["job_id"], job["game_id"], job["status"], job["result"] if job["status"] == "done" else None)
+        except Exception as e:
+            logger.info(f"Status callback of evaluation job {job['job_id']} failed: {e}")
+
+    def _evict(self):
+        while len(self._jobs) > self.max_jobs:
+            job_id, job = self._jobs.popitem(last=False)
+            if self._latest.get(job["game_id"]) == job_id:
+                del self._latest[job["game_id"]]
+
+    def get(self, job_id, wait=0):
+        """Returns the public state of a job, optionally waiting up to `wait` seconds for it to finish."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        future = job.get("future")
+        if wait and future is not None and job["status"] in ("pending", "running"):
+            try:
+                future.result(timeout=wait)
+            except Exception:
+                pass
+        return {key: job[key] for key in ("job_id", "game_id", "status", "result")}
+
+    def metrics(self):
+        with self._lock:
+            counts = collections.Counter(job["status"] for job in self._jobs.values())
+        return dict(counts)
+
+    def shutdown(self):
+        with self._lock:
+            for job in self._jobs.values():
+                self._cancel(job)
+        self._executor.shutdown(wait=False, cancel_futures=True)
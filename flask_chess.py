@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, Response, render_template, request, jsonify, session
 import chess
 import chess.pgn
 from groq import Groq
@@ -8,10 +8,37 @@ import atexit
 import traceback
 import logging
 import webbrowser
+import uuid
+import time
+import collections
+import threading
+import concurrent.futures
+import click
+from engine_pool import EnginePool, EnginePoolTimeout
+from analysis_cache import AnalysisCache, entry_from_infos, line_score
+from analysis_store import AnalysisStore, position_epd
+from prefetch import Prefetcher
+from analysis_budget import AnalysisBudget
+from opening_book import OpeningBook
+from tablebase import Tablebase, format_tablebase_score
+from eval_jobs import EvalJobQueue, AnalysisCancelled
+from game_review import GameReview, summarize
+from game_analytics import analyse_game, analyse_games
+from move_heatmap import MoveHeatmap, score_losses
+from ponder import Ponderer
+from engine_worker import RemoteEngines, WorkerUnavailable
+from singleflight import SingleFlight
+from engine_scheduler import parse_class_caps, priority_class
+from live_games import LiveGames
+from game_state import GameState
+from game_codec import encode_moves, from_pgn, from_text, to_pgn, to_text
+from shared_games import SharedGameStore
+from session_store import ServerSessionInterface, MemorySessionStore, SqliteSessionStore, RedisSessionStore
 
 app = Flask(__name__)
 app.logger.setLevel(logging.INFO)
-app.secret_key = os.urandom(24)  # For session management
+# Must be set (and identical) for all worker processes, or sessions break across workers and restarts
+app.secret_key = os.environ.get("SECRET_KEY") or os.urandom(24)  # For session management
 
 # Initialize Groq client - replace with your API key
 groq_client = Groq(api_key=os.environ.get("GROQ_API_KEY"))
@@ -20,13 +47,130 @@ model_name = "deepseek-r1-distill-llama-70b" # "gemma2-9b-it"
 # --- Configuration ---
 # Set the correct path to your Stockfish executable
 # STOCKFISH_PATH = ".\engine\stockfish\stockfish-windows-x86-64-avx2.exe"
-STOCKFISH_PATH = "./engine/stockfish/stockfish/stockfish-ubuntu-x86-64-avx2"
+STOCKFISH_PATH = os.environ.get("STOCKFISH_PATH", "./engine/stockfish/stockfish/stockfish-ubuntu-x86-64-avx2")
 
 # Time in seconds for engine analysis (adjust as needed)
-ANALYSIS_TIME_LIMIT = 0.3 
+# Caps the move-time evaluation; other call sites have their own budgets in analysis_budget.py
+ANALYSIS_TIME_LIMIT = float(os.environ.get("ANALYSIS_TIME_LIMIT", 0.3))
 
-# Initialize with the correct structure expected by later functions
-current_engine_analysis = {"best_score": "N/A", "top_moves": []}
+# How searches are limited: "depth" (time-capped), "nodes" (reproducible) or "time"
+ANALYSIS_BUDGET_MODE = os.environ.get("ANALYSIS_BUDGET_MODE", "depth")
+
+# Number of Stockfish processes to run in parallel (one search per process)
+# Web worker processes serving the app (see gunicorn.conf.py); each one owns its own engine pool
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", 1))
+
+# Defaults to an even share of the CPU cores per web worker
+ENGINE_POOL_SIZE = int(os.environ.get("ENGINE_POOL_SIZE", max(1, (os.cpu_count() or 1) // WEB_WORKERS)))
+
+# Seconds a request may wait for a free engine before giving up
+ENGINE_CHECKOUT_TIMEOUT = float(os.environ.get("ENGINE_CHECKOUT_TIMEOUT", 5.0))
+
+# Warm spare engines kept ready to replace crashed ones instantly
+ENGINE_SPARES = int(os.environ.get("ENGINE_SPARES", 1))
+
+# Seconds between supervisor health checks (isready pings) of idle engines
+ENGINE_HEALTH_INTERVAL = float(os.environ.get("ENGINE_HEALTH_INTERVAL", 5.0))
+
+# Transposition table size (MB) of each engine; games stick to one engine to reuse it
+ENGINE_HASH_MB = int(os.environ.get("ENGINE_HASH_MB", 64))
+
+# Remote engine workers (engine_worker.py) searched before the local pool, comma-separated
+# "tcp://host:port" or "unix:///path" addresses (empty to analyse locally only)
+ENGINE_WORKERS = [address.strip() for address in os.environ.get("ENGINE_WORKERS", "").split(",") if address.strip()]
+
+# Seconds between heartbeats to the remote engine workers
+ENGINE_WORKER_HEARTBEAT = float(os.environ.get("ENGINE_WORKER_HEARTBEAT", 2.0))
+
+# Most searches each priority class (interactive, tutor, speculative, batch) may run at once,
+# e.g. "batch=2,speculative=1"; batch review defaults to half the pool
+ENGINE_CLASS_CAPS = {"batch": max(1, ENGINE_POOL_SIZE // 2), **parse_class_caps(os.environ.get("ENGINE_CLASS_CAPS", ""))}
+
+# Seconds a batch (review) search may wait for an engine; it queues behind interactive work
+BATCH_CHECKOUT_TIMEOUT = float(os.environ.get("BATCH_CHECKOUT_TIMEOUT", 60.0))
+
+# SQLite file persisting analysis across restarts (empty to disable)
+ANALYSIS_STORE_PATH = os.environ.get("ANALYSIS_STORE_PATH", "analysis_store.sqlite3")
+
+# Optional Polyglot opening book (.bin) answered before calling Stockfish
+OPENING_BOOK_PATH = os.environ.get("OPENING_BOOK_PATH", "")
+
+# Optional Syzygy tablebase directories (separated by os.pathsep) probed instead of Stockfish
+SYZYGY_PATH = os.environ.get("SYZYGY_PATH", "")
+
+# Largest number of pieces (kings included) for which the tablebase is probed
+SYZYGY_MAX_PIECES = int(os.environ.get("SYZYGY_MAX_PIECES", 7))
+
+# Minimum search depth the tutor prompt accepts before re-analysing a position
+TUTOR_MIN_DEPTH = int(os.environ.get("TUTOR_MIN_DEPTH", 10))
+
+# Maximum number of positions kept in the shared analysis cache
+ANALYSIS_CACHE_SIZE = int(os.environ.get("ANALYSIS_CACHE_SIZE", 50000))
+
+# Maximum seconds a streamed (progressive-deepening) analysis keeps searching
+STREAM_TIME_LIMIT = float(os.environ.get("STREAM_TIME_LIMIT", 5.0))
+
+# Longest game (in plies) accepted by /review
+REVIEW_MAX_PLIES = int(os.environ.get("REVIEW_MAX_PLIES", 400))
+
+# Longest a client may long-poll /eval_job for a result (seconds)
+EVAL_JOB_MAX_WAIT = 10.0
+
+# Seconds between shared-store checks for an eval job running on another web worker
+SHARED_JOB_POLL_INTERVAL = 0.2
+
+# Seconds between shared-store checks for games another web worker moved on
+SHARED_POSITION_POLL_INTERVAL = 0.5
+
+# Seconds after which a job another web worker still reports as pending or running counts as failed
+SHARED_JOB_TIMEOUT = float(os.environ.get("SHARED_JOB_TIMEOUT", 120.0))
+
+# Pre-analyze likely next positions in the background while the user thinks
+SPECULATIVE_ANALYSIS = os.environ.get("SPECULATIVE_ANALYSIS", "1") == "1"
+
+# Keep an infinite search running on each game's current position (ponder mode)
+PONDER_MODE = os.environ.get("PONDER_MODE", "0") == "1"
+
+# Most games pondering at once; keep it below ENGINE_POOL_SIZE to leave engines for requests
+PONDER_MAX_SESSIONS = int(os.environ.get("PONDER_MAX_SESSIONS", max(1, ENGINE_POOL_SIZE // 2)))
+
+# Longest a single position is pondered (seconds)
+PONDER_MAX_TIME = float(os.environ.get("PONDER_MAX_TIME", 60.0))
+
+# Most game boards kept in memory; older games are rebuilt from their move list on their next request
+MAX_LIVE_GAMES = int(os.environ.get("MAX_LIVE_GAMES", 10000))
+
+# Where session data lives: "memory", "sqlite", "redis" or "cookie" (Flask's signed cookie)
+# Several web workers need a store they all see
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "memory" if WEB_WORKERS == 1 else "sqlite")
+
+# SQLite file of the "sqlite" session backend
+SESSION_STORE_PATH = os.environ.get("SESSION_STORE_PATH", "session_store.sqlite3")
+
+# Redis server of the "redis" session backend
+SESSION_REDIS_URL = os.environ.get("SESSION_REDIS_URL", "redis://localhost:6379/0")
+
+# Seconds an unused session is kept
+SESSION_TTL = int(os.environ.get("SESSION_TTL", 7 * 24 * 3600))
+
+# Session data (move and chat history) is kept server-side, the cookie only holds the session id
+session_store = None
+if SESSION_BACKEND == "memory":
+    session_store = MemorySessionStore()
+elif SESSION_BACKEND == "sqlite":
+    session_store = SqliteSessionStore(SESSION_STORE_PATH)
+elif SESSION_BACKEND == "redis":
+    session_store = RedisSessionStore(SESSION_REDIS_URL)
+elif SESSION_BACKEND != "cookie":
+    raise ValueError(f"Unknown SESSION_BACKEND: {SESSION_BACKEND} (expected memory, sqlite, redis or cookie)")
+if WEB_WORKERS > 1 and SESSION_BACKEND == "memory":
+    raise ValueError("SESSION_BACKEND=memory cannot be shared by several web workers, use sqlite or redis")
+if WEB_WORKERS > 1 and SESSION_BACKEND == "cookie" and not os.environ.get("SECRET_KEY"):
+    raise ValueError("SECRET_KEY must be set when several web workers share cookie sessions")
+if WEB_WORKERS > 1 and not ANALYSIS_STORE_PATH:
+    raise ValueError("ANALYSIS_STORE_PATH must be set when several web workers share eval jobs")
+if session_store is not None:
+    app.session_interface = ServerSessionInterface(session_store, ttl=SESSION_TTL)
 
 # Initialize default display message  
 system_prompt = "Send the first message to the AI Tutor to generate system prompt."
@@ -41,110 +185,267 @@ if not os.path.exists(STOCKFISH_PATH):
 
 # --- Engine Initialization & Cleanup ---
 def initialize_engine():
-    """Initializes the Stockfish engine process."""
-    global engine
+    """Starts the pool of Stockfish engine processes."""
+    global engine_pool
+    engine_pool = EnginePool(STOCKFISH_PATH, size=ENGINE_POOL_SIZE, checkout_timeout=ENGINE_CHECKOUT_TIMEOUT,
+                             spares=ENGINE_SPARES, health_interval=ENGINE_HEALTH_INTERVAL,
+                             options={"Hash": ENGINE_HASH_MB, "Threads": 1}, class_caps=ENGINE_CLASS_CAPS)
     if not os.path.exists(STOCKFISH_PATH):
         app.logger.info("Engine initialization skipped: Stockfish path invalid.")
-        engine = None
         return
 
-    try:
-        engine = chess.engine.SimpleEngine.popen_uci(STOCKFISH_PATH)
-        # Configure basic UCI options if needed 
-        # engine.configure({"Skill Level": 10}) # Example: Adjust skill level (0-20)
-        app.logger.info(f"Stockfish engine initialized successfully from: {STOCKFISH_PATH}")
-        # Ensure engine is closed properly when the script exits
-        atexit.register(close_engine)
-    except chess.engine.EngineTerminatedError:
-         app.logger.info(f"ERROR: Stockfish engine terminated unexpectedly after starting.")
-         app.logger.info(f"Check if the executable at {STOCKFISH_PATH} is corrupted or incompatible.")
-         engine = None
-    except Exception as e:
-        app.logger.info(f"ERROR: Failed to initialize Stockfish engine: {e}")
-        app.logger.info(f"Traceback: {traceback.format_exc()}")
-        engine = None
+    if engine_pool.start():
+        app.logger.info(f"Stockfish engine pool initialized successfully from: {STOCKFISH_PATH}")
+    else:
+        app.logger.info("Unable to setup engine pool.")
 
 def close_engine():
-    """Closes the engine process gracefully."""
-    global engine
-    if engine:
-        app.logger.info("Closing Stockfish engine...")
-        try:
-            engine.quit()
-        except chess.engine.EngineTerminatedError:
-            app.logger.info("Engine already terminated.")
-        except Exception as e:
-            app.logger.info(f"Error closing engine: {e}")
-        engine = None
-    elif engine: # Engine object exists but process might be dead
-        app.logger.info("Engine process was not alive. Setting engine object to None.")
-        engine = None
+    """Closes all engine processes gracefully."""
+    if engine_pool:
+        engine_pool.close()
+
+# Analysis results shared by all sessions, keyed by position, backed by the on-disk store
+analysis_store = AnalysisStore(ANALYSIS_STORE_PATH) if ANALYSIS_STORE_PATH else None
+if analysis_store:
+    atexit.register(analysis_store.close)
+analysis_cache = AnalysisCache(max_entries=ANALYSIS_CACHE_SIZE, store=analysis_store)
+
+# Opening book fast path for standard theory positions
+opening_book = None
+if OPENING_BOOK_PATH:
+    try:
+        opening_book = OpeningBook(OPENING_BOOK_PATH)
+        atexit.register(opening_book.close)
+        app.logger.info(f"Opening book loaded from: {OPENING_BOOK_PATH}")
+    except OSError as e:
+        app.logger.info(f"WARNING: Opening book not loaded from {OPENING_BOOK_PATH}: {e}")
+
+# Syzygy tablebases for exact endgame results, handles kept open across requests
+tablebase = None
+if SYZYGY_PATH:
+    tablebase = Tablebase(SYZYGY_PATH, max_pieces=SYZYGY_MAX_PIECES)
+    atexit.register(tablebase.close)
+    app.logger.info(f"Syzygy tablebases loaded from: {SYZYGY_PATH} (up to {tablebase.max_pieces} pieces)")
 
 # Initialize Stockfish 
+engine_pool = None
 initialize_engine()
-app.logger.info(engine)
+app.logger.info(engine_pool.metrics())
+
+# Engine capacity on other processes or machines, load balanced with failover
+remote_engines = None
+if ENGINE_WORKERS:
+    remote_engines = RemoteEngines(ENGINE_WORKERS, heartbeat_interval=ENGINE_WORKER_HEARTBEAT)
+    atexit.register(remote_engines.close)
+    app.logger.info(f"{remote_engines.start()}/{len(ENGINE_WORKERS)} engine worker(s) up")
+
+# Search limits per call site, adapted to engine load
+analysis_budget = AnalysisBudget(engine_pool, mode=ANALYSIS_BUDGET_MODE, site_budgets={"eval": {"time": ANALYSIS_TIME_LIMIT}})
+
+# In-flight searches, so concurrent requests for one position start a single search
+singleflight = SingleFlight()
+
+# Background pre-analysis of likely next positions
+prefetcher = Prefetcher(engine_pool, analysis_cache, analysis_budget)
+if SPECULATIVE_ANALYSIS and engine_pool.available:
+    prefetcher.start()
+
+# Eval job statuses published to the other web workers, which may be polled for them
+shared_games = SharedGameStore(ANALYSIS_STORE_PATH) if WEB_WORKERS > 1 else None
+
+# Evaluations of new positions run here so routes can answer right after validation
+eval_jobs = EvalJobQueue(max_workers=ENGINE_POOL_SIZE, on_status=shared_games.record_job if shared_games else None)
+
+# Scores of every legal move, searched across the pool and cached per position
+heatmap_store = AnalysisStore(ANALYSIS_STORE_PATH, table="heatmap") if ANALYSIS_STORE_PATH else None
+if heatmap_store:
+    atexit.register(heatmap_store.close)
+move_heatmap = MoveHeatmap(engine_pool, analysis_budget, store=heatmap_store)
+
+# Batch analysis of the earlier positions of games loaded with /load_game
+history_analysis = concurrent.futures.ThreadPoolExecutor(max_workers=ENGINE_CLASS_CAPS.get("batch") or ENGINE_POOL_SIZE,
+                                                         thread_name_prefix="history-analysis")
+# Queued history analysis of each game, cancelled when the game is replaced
+history_tasks = collections.OrderedDict()
+history_tasks_lock = threading.Lock()
+
+# Continuous analysis of each game's current position (PONDER_MODE)
+ponderer = Ponderer(engine_pool, analysis_cache, max_sessions=PONDER_MAX_SESSIONS, max_time=PONDER_MAX_TIME)
+
+# Each game's board with its full move stack, rebuilt from the session's moves when evicted
+live_games = LiveGames(max_games=MAX_LIVE_GAMES)
+
+def get_game_id():
+    """Returns the id of the session's current game, creating one if needed."""
+    if 'game_id' not in session:
+        session['game_id'] = uuid.uuid4().hex
+    return session['game_id']
+
+# Latest position of each game as `(fen, time.time() it was reached)`, so long-running work can tell when it changed
+game_positions = collections.OrderedDict()
+game_positions_lock = threading.Lock()
+MAX_TRACKED_GAMES = 10000
+
+def session_moves():
+    """Returns the session's moves in the 2-byte encoding of game_codec.py.
+
+    Sessions from before the encoding, with a SAN `move_history`, are converted once.
+    """
+    moves = session.get('moves')
+    if moves is not None:
+        return from_text(moves)
+    board = chess.Board()
+    data = encode_moves(board.push_san(san_move) for san_move in session.pop('move_history', []))
+    set_session_moves(data)
+    return data
+
+def set_session_moves(data):
+    session['moves'] = to_text(data)
+
+def live_game():
+    """Locks and yields the session's live GameState (use in a `with` block)."""
+    return live_games.game(get_game_id(), session_moves(), session.get('start_fen'))
+
+def current_board():
+    """Returns a copy of the session's live board, move stack included."""
+    return live_games.snapshot(get_game_id(), session_moves(), session.get('start_fen'))
+
+def set_game_position(game_id, fen):
+    """Records the current position of a game (an empty `fen` once it ended), for every web worker."""
+    updated = time.time()
+    with game_positions_lock:
+        game_positions[game_id] = (fen, updated)
+        game_positions.move_to_end(game_id)
+        while len(game_positions) > MAX_TRACKED_GAMES:
+            game_positions.popitem(last=False)
+    if shared_games:
+        shared_games.set_position(game_id, fen, updated)
+
+def is_current_position(game_id, fen):
+    """True while `fen` is still the latest position of the game."""
+    with game_positions_lock:
+        position = game_positions.get(game_id)
+        return position is None or position[0] == fen
+
+def submit_history_analysis(game_id, boards):
+    """Queues batch analysis of a game's earlier positions."""
+    futures = [history_analysis.submit(analyse_history_position, board, game_id) for board in boards]
+    with history_tasks_lock:
+        pending = [future for future in history_tasks.pop(game_id, []) if not future.done()]
+        history_tasks[game_id] = pending + futures
+        while len(history_tasks) > MAX_TRACKED_GAMES:
+            history_tasks.popitem(last=False)
+
+def cancel_history_analysis(game_id):
+    """Drops a game's history analysis that has not started yet."""
+    with history_tasks_lock:
+        futures = history_tasks.pop(game_id, [])
+    for future in futures:
+        future.cancel()
+
+def stop_game_work(game_id, ended=False):
+    """Stops the background work on a game's previous position, and all of it once the game ended."""
+    prefetcher.cancel(game_id)
+    eval_jobs.cancel_game(game_id)
+    ponderer.stop(game_id)
+    if ended:
+        cancel_history_analysis(game_id)
+
+def follow_shared_positions():
+    """Stops this worker's work on the games whose next position another web worker received.
+
+    The changed game also ends this worker's streams of it, through `is_current_position`.
+    """
+    since = time.time()
+    while True:
+        time.sleep(SHARED_POSITION_POLL_INTERVAL)
+        now = time.time()
+        for game_id, fen, updated in shared_games.positions_since(since):
+            with game_positions_lock:
+                position = game_positions.get(game_id)
+                # Only games this worker works on, and only positions newer than its own
+                if position is None or updated <= position[1] or fen == position[0]:
+                    continue
+                game_positions[game_id] = (fen, updated)
+            stop_game_work(game_id, ended=not fen)
+        # Overlap the windows, a write may commit a little after its timestamp
+        since = now - 1.0
+
+if shared_games:
+    threading.Thread(target=follow_shared_positions, name="shared-positions", daemon=True).start()
+
+# Shown until the tutor is first asked
+DEFAULT_SYSTEM_PROMPT = "Ask a question to the AI Tutor to generate the system prompt."
 
 @app.route('/')
 def index():
     # Initialize a new game if none exists
     if 'board_fen' not in session:
         session['board_fen'] = chess.Board().fen()
-        session['move_history'] = []
-        session['chat_history'] = []
-        session['stockfish_eval'] = get_board_eval(chess.Board(session['board_fen']))
-        session['system_prompt'] = "Ask a question to the AI Tutor to generate the system prompt."
-    
+        set_session_moves(b"")
+        live_games.reset(get_game_id())
+        analyse_game_position(chess.Board(session['board_fen']))
+    # Also set up the page state of a game started by /make_move or /load_game
+    session.setdefault('chat_history', [])
+    session.setdefault('system_prompt', DEFAULT_SYSTEM_PROMPT)
+    session.setdefault('stockfish_eval', "N/A")
+    with live_game() as game:
+        move_history = list(game.sans)
+
     return render_template('index.html', 
                           board_fen=session['board_fen'],
-                          move_history=session['move_history'],
+                          move_history=move_history,
                           chat_history=session['chat_history'],
                           system_prompt=session['system_prompt'],
                           stockfish_eval=session['stockfish_eval'])
 
+# Result message shown when a move ends the game, by GameState.termination()
+GAME_RESULTS = {
+    "checkmate": 'Checkmate!',
+    "stalemate": 'Stalemate!',
+    "insufficient_material": 'Draw due to insufficient material!',
+    "seventyfive_moves": 'Draw by the 75-move rule!',
+    "fivefold_repetition": 'Draw by fivefold repetition!',
+}
+
 @app.route('/make_move', methods=['POST'])
 def make_move():
     data = request.json
     source = data.get('source')
     target = data.get('target')
     
-    # Load current board state
-    board = chess.Board(session['board_fen'])
-    
     # Create and validate the move
     move = chess.Move.from_uci(f"{source}{target}")
     try:
-        if move in board.legal_moves:
-            # Get move in algebraic notation before making the move
-            san_move = board.san(move)
-            
-            # Make the move
-            board.push(move)
-            
+        # Validate and play the move on the game's live board
+        with live_game() as game:
+            legal = move in game.board.legal_moves
+            if legal:
+                # Make the move, getting it in algebraic notation
+                san_move = game.push(move)
+                board = game.board.copy()
+                termination = game.termination()
+
+        if legal:
             # Update session
             session['board_fen'] = board.fen()
-            session['move_history'] = session.get('move_history', []) + [san_move]
+            set_session_moves(session_moves() + encode_moves([move]))
             
             result = {
                 'success': True,
                 'fen': board.fen(),
                 'move': san_move,
-                'is_game_over': board.is_game_over(),
+                'is_game_over': termination is not None,
                 'is_check': board.is_check()
             }
 
             
-            result['stockfish_eval'] = get_board_eval(board)
-            session['stockfish_eval'] = result['stockfish_eval']
+            # Evaluation is only inline on a cache or book hit, otherwise it arrives via /eval_job
+            result['stockfish_eval'], result['eval_job_id'] = request_position_analysis(board)
+            result['opening_book'] = is_book_position(board)
             
-            if board.is_game_over():
-                if board.is_checkmate():
-                    result['game_result'] = 'Checkmate!'
-                elif board.is_stalemate():
-                    result['game_result'] = 'Stalemate!'
-                elif board.is_insufficient_material():
-                    result['game_result'] = 'Draw due to insufficient material!'
-                else:
-                    result['game_result'] = 'Game over!'
+            if termination is not None:
+                result['game_result'] = GAME_RESULTS.get(termination, 'Game over!')
         else:
             result = {'success': False, 'message': 'Invalid move'}
     except Exception as e:
@@ -153,74 +454,182 @@ def make_move():
     
     return jsonify(result)
 
+def start_new_game(board):
+    """Replaces the session's game with `board` (its start position and move stack) under a new game id."""
+    old_game_id = get_game_id()
+    stop_game_work(old_game_id, ended=True)
+    # Ends the old game's streams and background work on every web worker
+    set_game_position(old_game_id, "")
+    live_games.discard(old_game_id)
+    session['game_id'] = uuid.uuid4().hex
+    live_games.reset(session['game_id'], board)
+    # Keep the game's engine, but clear its transposition table with ucinewgame
+    engine_pool.new_game(old_game_id, session['game_id'])
+    start_fen = board.root().fen()
+    if start_fen == chess.STARTING_FEN:
+        session.pop('start_fen', None)
+    else:
+        session['start_fen'] = start_fen
+    session['board_fen'] = board.fen()
+    set_session_moves(encode_moves(board.move_stack))
+    session['chat_history'] = []
+    session['system_prompt'] = DEFAULT_SYSTEM_PROMPT
+
 @app.route('/new_game', methods=['POST'])
 def new_game():
-    session['board_fen'] = chess.Board().fen()
-    session['move_history'] = []
-    session['chat_history'] = []
-    session['system_prompt'] = "Ask a question to the AI Tutor to generate the system prompt."
+    start_new_game(chess.Board())
+    analyse_game_position(chess.Board())
     
     return jsonify({
         'success': True,
         'fen': session['board_fen'],
-        'move_history': session['move_history'],
+        'move_history': [],
         'system_prompt': session['system_prompt'],
         'stockfish_eval': session['stockfish_eval']
     })
 
+@app.route('/load_game', methods=['POST'])
+def load_game():
+    """Loads a whole game in one request and evaluates only its final position.
+
+    POST JSON with one of:
+    - `{"pgn": "..."}`: the PGN's mainline, from its FEN header if any,
+    - `{"moves": ["e2e4", "e7e5", ...]}`: UCI moves, optionally with a start `"fen"`,
+    - `{"fen": "..."}`: a position without history.
+    The final position gets an eval job like /make_move. With
+    `"analyse_history": true` the earlier positions are queued for batch
+    (lowest priority) analysis, so a later /review or undo finds them cached.
+    """
+    data = request.get_json(silent=True) or {}
+    for key in ('pgn', 'fen'):
+        if data.get(key) is not None and not isinstance(data[key], str):
+            return jsonify({'success': False, 'message': f'{key} must be a string'}), 400
+    if data.get('pgn'):
+        parsed = from_pgn(data['pgn'])
+        if parsed is None:
+            return jsonify({'success': False, 'message': 'Invalid PGN'}), 400
+        board, moves = parsed
+    else:
+        try:
+            board = chess.Board(data['fen']) if data.get('fen') else chess.Board()
+        except ValueError as e:
+            return jsonify({'success': False, 'message': f'Invalid FEN: {e}'}), 400
+        if not board.is_valid():
+            return jsonify({'success': False, 'message': 'Invalid FEN: illegal position'}), 400
+        moves = data.get('moves') or []
+        if not isinstance(moves, list):
+            return jsonify({'success': False, 'message': 'moves must be a list of UCI moves'}), 400
+
+    if len(moves) > REVIEW_MAX_PLIES:
+        return jsonify({'success': False, 'message': f'Games longer than {REVIEW_MAX_PLIES} plies cannot be loaded'}), 400
+
+    # Validate every move in one pass, building the move stack as we go
+    for ply, move in enumerate(moves):
+        try:
+            move = move if isinstance(move, chess.Move) else chess.Move.from_uci(move)
+        except (TypeError, ValueError):
+            move = None
+        if move is None or not board.is_legal(move):
+            return jsonify({'success': False, 'message': f'Illegal move at ply {ply + 1}: {moves[ply]}'}), 400
+        board.push(move)
+
+    start_new_game(board)
+    stockfish_eval, eval_job_id = request_position_analysis(board.copy())
+
+    if data.get('analyse_history') and board.move_stack:
+        positions = []
+        position = board.root()
+        for move in board.move_stack[:-1]:
+            position.push(move)
+            positions.append(position.copy(stack=False))
+        submit_history_analysis(get_game_id(), positions)
+
+    with live_game() as game:
+        termination = game.termination()
+        move_history = list(game.sans)
+    return jsonify({
+        'success': True,
+        'fen': board.fen(),
+        'move_history': move_history,
+        'system_prompt': session['system_prompt'],
+        'stockfish_eval': stockfish_eval,
+        'eval_job_id': eval_job_id,
+        'opening_book': is_book_position(board),
+        'is_game_over': termination is not None,
+        'game_result': GAME_RESULTS.get(termination)
+    })
+
+@app.route('/export_pgn')
+def export_pgn():
+    """Downloads the session's game (from its start position) as PGN."""
+    pgn = to_pgn(current_board(), headers={"Event": "Chess tutor game", "Date": time.strftime("%Y.%m.%d")})
+    return Response(pgn + "\n", mimetype='application/x-chess-pgn',
+                    headers={'Content-Disposition': 'attachment; filename="game.pgn"'})
+
+def analyse_history_position(board, game_id):
+    """Background analysis of an earlier position of a loaded game (batch priority)."""
+    try:
+        analyse_position(board, multipv=3, call_site="review", tenant=game_id)
+    except Exception as e:
+        app.logger.info(f"History analysis failed for {board.fen()}: {e}")
+
 @app.route('/undo_move', methods=['POST'])
 def undo_move():
-    # Load current board state
-    board = chess.Board()
-    
-    # Replay all moves except the last one
-    move_history = session.get('move_history', [])
-    
-    if not move_history:
+    moves = session_moves()
+    if not moves:
         return jsonify({'success': False, 'message': 'No moves to undo'})
-    
-    # Remove the last move
-    move_history.pop()
-    
-    # Replay remaining moves
-    for san_move in move_history:
-        board.push_san(san_move)
-    
+
+    # Take back the last move on the game's live board
+    with live_game() as game:
+        game.pop()
+        board = game.board.copy()
+        move_history = list(game.sans)
+
     # Update session
     session['board_fen'] = board.fen()
-    session['move_history'] = move_history
-    session['stockfish_eval'] = get_board_eval(board)
+    set_session_moves(moves[:-2])
+    stockfish_eval, eval_job_id = request_position_analysis(board)
     
     return jsonify({
         'success': True,
         'fen': board.fen(),
         'move_history': move_history,
-        'system_prompt': session['system_prompt'],
-        'stockfish_eval': session['stockfish_eval']
+        'system_prompt': session.get('system_prompt', DEFAULT_SYSTEM_PROMPT),
+        'stockfish_eval': stockfish_eval,
+        'eval_job_id': eval_job_id,
+        'opening_book': is_book_position(board)
     })
 
 @app.route('/get_game_status', methods=['POST'])
-def get_game_status(board):
-    """Determines and returns the current game status string."""
-    if board.is_checkmate():
+def get_game_status(board, game=None):
+    """Determines and returns the current game status string.
+
+    Pass the live GameState as `game` to use its O(1) repetition and move-rule
+    tracking; without it only the position itself is considered.
+    """
+    if game is None:
+        game = GameState(board.copy(stack=False))
+    termination = game.termination()
+    if termination == "checkmate":
         winner = "Black" if board.turn == chess.WHITE else "White"
         return f"Checkmate! {winner} wins!"
-    elif board.is_stalemate():
+    elif termination == "stalemate":
         return "Stalemate! Draw."
-    elif board.is_insufficient_material():
+    elif termination == "insufficient_material":
         return "Draw: Insufficient Material."
-    elif board.is_seventyfive_moves():
+    elif termination == "seventyfive_moves":
         return "Draw: 75-move rule."
-    elif board.is_fivefold_repetition():
+    elif termination == "fivefold_repetition":
         return "Draw: Fivefold Repetition."
-    elif board.is_variant_draw(): # Handles other draw types if applicable
-        return "Draw."
-    elif board.is_check():
-        turn_str = "White" if board.turn == chess.WHITE else "Black"
-        return f"{turn_str} to move (in Check)"
-    else:
-        turn_str = "White" if board.turn == chess.WHITE else "Black"
-        return f"{turn_str} to move"
+
+    turn_str = "White" if board.turn == chess.WHITE else "Black"
+    status = f"{turn_str} to move (in Check)" if board.is_check() else f"{turn_str} to move"
+    notes = []
+    if game.repetitions() > 1:
+        notes.append(f"position occurred {game.repetitions()} times")
+    if game.claimable_draws():
+        notes.append(f"draw claimable by {' and '.join(game.claimable_draws())}")
+    return f"{status} ({'; '.join(notes)})" if notes else status
 
 # --- Helper Functions ---
 @app.route('/format_score', methods=['POST'])
@@ -241,122 +650,561 @@ def format_score(score_obj):
         pawn_units = cp / 100.0
         return f"Stockfish Evaluation: {pawn_units:+.2f}" # Format like +1.23 or -0.50
     
-@app.route('/board_eval_score', methods=['POST'])
-def get_board_eval(current_board):
-    """Analyzes current board position and returns top line engine evaluation."""
-    global engine, current_engine_analysis
-
-    eval_score = "N/A"
-
-    # Engine initialization logic
-    if not engine:
-        app.logger.info("No engine available, trying to set up engine...")
-        initialize_engine()
-        if not engine:
-            app.logger.info("Unable to setup engine.")
-        else: 
-            app.logger.info("Engine set up successfully.")
+def analyse_position(current_board, multipv=1, min_depth=0, cancel_event=None, call_site="eval", affinity=None, tenant=None):
+    """Returns the analysis entry for a position, searching with Stockfish only on a cache miss.
 
-    try:
-        # Request analysis with Stockfish
-        app.logger.info("Requesting engine analysis...")
-        infos = engine.analyse(
-            current_board,
-            chess.engine.Limit(time=ANALYSIS_TIME_LIMIT),
-            multipv=1  # Get top 1 line
-        )
+    The search limit comes from the analysis budget of `call_site`. If
+    `cancel_event` is given, the search is stopped as soon as it is set and
+    AnalysisCancelled is raised instead of returning a partial result.
+    `affinity` (the game id) routes the search to the game's sticky engine
+    when it is free. Waiting searches are scheduled by the priority class of
+    `call_site` and round-robin by `tenant` (defaults to `affinity`).
+    """
+    entry = analysis_cache.get(current_board, multipv=multipv, min_depth=min_depth)
+    if entry is not None:
+        return entry
 
-        if not isinstance(infos, list):
-            infos = [infos]
+    limit = analysis_budget.limit(call_site, current_board)
+    # Sessions asking for the same position at once share one search
+    return singleflight.run(current_board, multipv, limit, cancel_event=cancel_event,
+                            search=lambda: search_and_cache(current_board, limit, multipv, cancel_event, affinity,
+                                                            priority_class(call_site), tenant))
 
-        app.logger.info(f"Formating score...")
-        eval_score = format_score(infos[0]['score'].white())
-        # eval_score = format_score(infos[0])
-    except Exception as e:
-        app.logger.info(f"Error during engine evaluation: {e}")
+def search_and_cache(current_board, limit, multipv, cancel_event=None, affinity=None, priority="interactive", tenant=None):
+    """Searches a position with Stockfish, stores the result in the analysis cache and returns its entry.
 
-    return eval_score
+    The search runs on a remote engine worker when one is up, otherwise on the local pool.
+    """
+    entry = None
+    if remote_engines is not None and remote_engines.available:
+        try:
+            entry = remote_engines.analyse(current_board, limit, multipv=multipv, affinity=affinity,
+                                           cancel_event=cancel_event, priority=priority, tenant=tenant)
+        except WorkerUnavailable:
+            if not engine_pool.available:
+                raise
+            app.logger.info("No engine worker available, analysing locally...")
+    if entry is not None:
+        analysis_cache.put(current_board, entry)
+        return entry
 
-@app.route('/get_engine_analysis', methods=['POST'])
-def get_engine_analysis(current_board):
-    """Analyzes current position and returns top 3 lines with up to 4 moves each."""
-    global engine, current_engine_analysis
-    analysis_results = {"best_score": "Engine N/A", "top_moves": []}
-
-    # Engine initialization logic
-    if not engine:
-        app.logger.info("No engine available, trying to set up engine...")
-        initialize_engine()
-        if not engine:
-            app.logger.info("Unable to setup engine.")
-            analysis_results["best_score"] = "Engine Dead" if engine else "Engine N/A"
-            current_engine_analysis = analysis_results
-            return current_engine_analysis
-        else: 
-            app.logger.info("Engine set up successfully.")
+    # One retry on another engine: the supervisor retires a crashed engine and promotes a spare
+    for attempt in range(2):
+        try:
+            infos = search_position(current_board, limit, multipv, cancel_event, affinity, priority, tenant)
+            break
+        except chess.engine.EngineTerminatedError:
+            if attempt or not engine_pool.available:
+                raise
+            app.logger.info("Engine died during analysis, retrying on another engine...")
 
-    try:
-        # Request analysis with MultiPV
-        infos = engine.analyse(
-            current_board,
-            chess.engine.Limit(time=ANALYSIS_TIME_LIMIT),
-            multipv=3  # Get top 3 lines
-        )
+    entry = entry_from_infos(infos)
+    analysis_cache.put(current_board, entry)
+    return entry
 
-        if not isinstance(infos, list):
-            infos = [infos]
-
-        processed_lines = []
-        for i, info in enumerate(infos):
-            # Score processing
-            score_obj = info.get("score")
-            if not score_obj:
-                continue
-            white_score = score_obj.white()
-            formatted_score = format_score(white_score)
-
-            # Process principal variation (PV)
-            move_line = []
-            temp_board = current_board.copy()
-            
-            # Extract up to 4 moves from PV
-            for move_in_pv in info.get("pv", [])[:4]:  # Limit to first 4 moves
-                try:
-                    if not temp_board.is_legal(move_in_pv):
-                        break
-                    
-                    san = temp_board.san(move_in_pv)
-                    move_line.append(san)
-                    temp_board.push(move_in_pv)  # Update board state
-                except Exception as e:
-                    app.logger.error(f"Error processing move {move_in_pv}: {e}")
-                    break
+def search_position(current_board, limit, multipv, cancel_event=None, affinity=None, priority="interactive", tenant=None):
+    """Runs one Stockfish search on a pooled engine and returns its infos."""
+    timeout = BATCH_CHECKOUT_TIMEOUT if priority == "batch" else None
+    with engine_pool.checkout(timeout=timeout, affinity=affinity, priority=priority, tenant=tenant) as engine:
+        game = engine_pool.game_token(engine)
+        if cancel_event is None:
+            return engine.analyse(current_board, limit, multipv=multipv, game=game)
 
-            if move_line:  # Only add lines with valid moves
-                processed_lines.append({
-                    "score": formatted_score,
-                    "move_line": move_line
-                })
+        if cancel_event.is_set():
+            raise AnalysisCancelled()
+        with engine.analysis(current_board, limit, multipv=multipv, game=game) as analysis:
+            for _ in analysis:
+                if cancel_event.is_set():
+                    raise AnalysisCancelled()
+            return analysis.multipv
 
-            # Set best score from top line
-            if i == 0 and processed_lines:
-                analysis_results["best_score"] = formatted_score
+def format_move_line(current_board, pv, max_moves=4):
+    """Converts the first moves of a UCI principal variation to SAN."""
+    move_line = []
+    temp_board = current_board.copy()
+
+    for uci in pv[:max_moves]:
+        try:
+            move_in_pv = chess.Move.from_uci(uci)
+            if not temp_board.is_legal(move_in_pv):
+                break
+
+            san = temp_board.san(move_in_pv)
+            move_line.append(san)
+            temp_board.push(move_in_pv)  # Update board state
+        except Exception as e:
+            app.logger.error(f"Error processing move {uci}: {e}")
+            break
+
+    return move_line
+
+def get_book_analysis(current_board):
+    """Returns the top opening book lines in the analysis format, or None when out of book."""
+    book_lines = opening_book.lookup(current_board) if opening_book else None
+    if not book_lines:
+        return None
+
+    top_moves = [{
+        "score": f"Book move ({line['share']}% of games)",
+        "move_line": format_move_line(current_board, line["pv"])
+    } for line in book_lines]
+
+    # Book positions have no score of their own; show an engine score only if one is already known
+    entry = analysis_cache.peek(current_board)
+    best_score = format_score(line_score(entry["lines"][0])) if entry else "Opening Book"
+    return {"best_score": best_score, "top_moves": top_moves, "depth": 0, "source": "book"}
+
+def get_tablebase_analysis(current_board):
+    """Returns the exact tablebase result and best lines in the analysis format, or None if not covered."""
+    result = tablebase.probe(current_board) if tablebase else None
+    if result is None:
+        return None
+
+    top_moves = [{
+        "score": format_tablebase_score(line["wdl"], line["dtz"], current_board.turn),
+        "move_line": format_move_line(current_board, line["pv"])
+    } for line in result["lines"]]
+    best_score = format_tablebase_score(result["wdl"], result["dtz"], current_board.turn)
+    return {"best_score": best_score, "top_moves": top_moves, "depth": 0, "source": "tablebase"}
+
+def is_tablebase_position(board):
+    """True if the position is small enough to be answered from the tablebase."""
+    return tablebase is not None and tablebase.covers(board)
+
+def is_book_position(board):
+    """True if the position is in the opening book."""
+    return opening_book is not None and opening_book.contains(board)
+
+@app.route('/get_engine_analysis', methods=['POST'])
+def get_engine_analysis(current_board, min_depth=0, cancel_event=None, call_site="eval", affinity=None):
+    """Analyzes current position and returns top 3 lines with up to 4 moves each.
 
-        analysis_results["top_moves"] = processed_lines[:3]  # Ensure max 3 lines
-        current_engine_analysis = analysis_results
-        return current_engine_analysis
+    Positions in the opening book or the endgame tablebase are answered without
+    Stockfish and marked with `"source": "book"` or `"source": "tablebase"`.
+    """
+    analysis_results = {"best_score": "Engine N/A", "top_moves": [], "depth": 0, "source": "engine"}
 
+    known_analysis = get_book_analysis(current_board) or get_tablebase_analysis(current_board)
+    if known_analysis is not None:
+        return known_analysis
+
+    try:
+        # Request analysis with MultiPV (top 3 lines)
+        entry = analyse_position(current_board, multipv=3, min_depth=min_depth, cancel_event=cancel_event,
+                                 call_site=call_site, affinity=affinity)
+        return format_engine_analysis(current_board, entry)
+
+    except AnalysisCancelled:
+        raise
     except chess.engine.EngineTerminatedError:
         app.logger.error("Engine terminated during analysis")
-        close_engine()
         analysis_results["best_score"] = "Engine Died"
         return analysis_results
+    except (EnginePoolTimeout, WorkerUnavailable) as e:
+        app.logger.error(f"Analysis skipped: {e}")
+        analysis_results["best_score"] = "Engine Busy" if engine_pool.available else "Engine N/A"
+        return analysis_results
     except Exception as e:
         app.logger.error(f"Analysis failed: {str(e)}")
         app.logger.debug(traceback.format_exc())
         analysis_results["best_score"] = "Analysis Error"
         return analysis_results
 
+def format_engine_analysis(current_board, entry):
+    """Converts an analysis entry into the top-3 display format of `get_engine_analysis`."""
+    analysis_results = {"best_score": "Engine N/A", "top_moves": [], "depth": entry["depth"], "source": "engine"}
+
+    processed_lines = []
+    for i, line in enumerate(entry["lines"]):
+        # Score processing
+        formatted_score = format_score(line_score(line))
+
+        # Process principal variation (PV), up to 4 moves
+        move_line = format_move_line(current_board, line["pv"])
+
+        if move_line:  # Only add lines with valid moves
+            processed_lines.append({
+                "score": formatted_score,
+                "move_line": move_line
+            })
+
+        # Set best score from top line
+        if i == 0 and processed_lines:
+            analysis_results["best_score"] = formatted_score
+
+    analysis_results["top_moves"] = processed_lines[:3]  # Ensure max 3 lines
+    return analysis_results
+
+def start_pondering(game_id, board):
+    """Starts the game's continuous search on a new position in ponder mode (not for book or tablebase positions)."""
+    if not PONDER_MODE:
+        return
+    if is_book_position(board) or is_tablebase_position(board):
+        ponderer.stop(game_id)
+    else:
+        ponderer.start(game_id, board)
+
+def pondered_analysis(board):
+    """Returns the deepest analysis of the session's running ponder search on this position, or None."""
+    entry = ponderer.snapshot(get_game_id(), board.fen()) if PONDER_MODE else None
+    if entry is None:
+        return None
+    return format_engine_analysis(board, entry)
+
+def analyse_game_position(board):
+    """Runs the one multipv=3 analysis of a new game position and stores it with the game state.
+
+    Returns the evaluation string for the eval display; `ask_tutor` reuses the
+    stored lines instead of searching the same position again.
+    """
+    set_game_position(get_game_id(), board.fen())
+    stockfish_eval = store_position_analysis(board.fen(), get_engine_analysis(board, affinity=get_game_id()))
+    start_pondering(get_game_id(), board)
+    return stockfish_eval
+
+def store_position_analysis(fen, analysis):
+    """Stores a position's analysis with the game state and returns the eval display string."""
+    session['engine_analysis'] = dict(analysis, fen=fen)
+    session['stockfish_eval'] = analysis["best_score"] if analysis["top_moves"] else "N/A"
+    return session['stockfish_eval']
+
+def request_position_analysis(board):
+    """Starts the analysis of a new game position without waiting for Stockfish.
+
+    Returns `(stockfish_eval, None)` when the position is already cached, else
+    `(None, job_id)` for an eval job the client polls at /eval_job/<job_id>.
+    Any job still running for the game's previous position is cancelled.
+    """
+    game_id = get_game_id()
+    set_game_position(game_id, board.fen())
+    prefetcher.cancel(game_id)
+    start_pondering(game_id, board)
+
+    # Only answer inline when no search is needed: a book move, a successful tablebase probe or a cache hit
+    known_analysis = get_book_analysis(board) or get_tablebase_analysis(board)
+    if known_analysis is not None or analysis_cache.peek(board, multipv=3) is not None:
+        eval_jobs.cancel_game(game_id)
+        session.pop('eval_job_id', None)
+        stockfish_eval = store_position_analysis(board.fen(), known_analysis or get_engine_analysis(board, affinity=game_id))
+        if SPECULATIVE_ANALYSIS:
+            prefetcher.schedule(game_id, board)
+        return stockfish_eval, None
+
+    session.pop('engine_analysis', None)
+    session['stockfish_eval'] = "N/A"
+    session['eval_job_id'] = eval_jobs.submit(game_id, run_eval_job, game_id, board.copy())
+    return None, session['eval_job_id']
+
+def run_eval_job(cancel_event, game_id, board):
+    """Eval job body: analyses the position, then schedules speculative pre-analysis.
+
+    In ponder mode the result is taken from the game's running search once it
+    reaches the eval budget's depth, instead of starting a second search.
+    """
+    analysis = None
+    if PONDER_MODE and ponderer.is_pondering(game_id, board.fen()):
+        limit = analysis_budget.limit("eval", board)
+        entry = ponderer.wait_for(game_id, board.fen(), limit.depth or TUTOR_MIN_DEPTH, timeout=limit.time or ANALYSIS_TIME_LIMIT)
+        if entry is not None:
+            analysis = format_engine_analysis(board, entry)
+    if analysis is None:
+        analysis = get_engine_analysis(board, cancel_event=cancel_event, affinity=game_id)
+    if SPECULATIVE_ANALYSIS and analysis["top_moves"]:
+        prefetcher.schedule(game_id, board)
+    return dict(analysis, fen=board.fen())
+
+def finished_eval_job_analysis(board, wait=0):
+    """Returns the analysis of the session's eval job if it finished for this position, else None."""
+    job_id = session.get('eval_job_id')
+    job = eval_jobs.get(job_id, wait=wait) if job_id else None
+    if not job or job['status'] != 'done' or job['result']['fen'] != board.fen():
+        return None
+    store_position_analysis(board.fen(), job['result'])
+    return job['result']
+
+@app.route('/eval_job/<job_id>')
+def eval_job(job_id):
+    """Reports an eval job's status; `?wait=N` long-polls up to N seconds for the result."""
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        wait = None
+    if wait is None or not wait >= 0:
+        return jsonify({'success': False, 'message': '"wait" must be a non-negative number of seconds'}), 400
+    wait = min(wait, EVAL_JOB_MAX_WAIT)
+    job = eval_jobs.get(job_id, wait=wait)
+    if job is None and job_id == session.get('eval_job_id'):
+        return jsonify(shared_eval_job(job_id, wait))
+    if job is None or job['game_id'] != session.get('game_id'):
+        return jsonify({'success': False, 'message': 'Unknown evaluation job'}), 404
+
+    result = {'success': True, 'job_id': job_id, 'status': job['status']}
+    if job['status'] == 'done':
+        analysis = job['result']
+        result['fen'] = analysis['fen']
+        result['stockfish_eval'] = analysis["best_score"] if analysis["top_moves"] else "N/A"
+        if job_id == session.get('eval_job_id') and analysis['fen'] == session.get('board_fen'):
+            store_position_analysis(analysis['fen'], analysis)
+    return jsonify(result)
+
+def shared_eval_job(job_id, wait=0):
+    """Reports the session's eval job when another web worker runs it.
+
+    That worker records the job's status and result in the shared store. A
+    job missing from the store is reported as `unknown`, and one still pending
+    or running after SHARED_JOB_TIMEOUT (e.g. its worker died) as `failed`.
+    """
+    deadline = time.monotonic() + wait
+    while True:
+        job = shared_games.job(job_id) if shared_games else None
+        if job is None or job['status'] not in ('pending', 'running') or time.monotonic() >= deadline:
+            break
+        time.sleep(SHARED_JOB_POLL_INTERVAL)
+    if job is None or job['game_id'] != session.get('game_id'):
+        return {'success': True, 'job_id': job_id, 'status': 'unknown'}
+    if job['status'] in ('pending', 'running') and time.time() - job['updated'] > SHARED_JOB_TIMEOUT:
+        return {'success': True, 'job_id': job_id, 'status': 'failed'}
+
+    result = {'success': True, 'job_id': job_id, 'status': job['status']}
+    if job['status'] == 'done':
+        analysis = job['result']
+        result['fen'] = analysis['fen']
+        result['stockfish_eval'] = analysis["best_score"] if analysis["top_moves"] else "N/A"
+        if analysis['fen'] == session.get('board_fen'):
+            store_position_analysis(analysis['fen'], analysis)
+    return result
+
+def stored_engine_analysis(board):
+    """Returns the session's stored analysis for this position if it is deep enough, else None."""
+    analysis = session.get('engine_analysis')
+    if not analysis or analysis.get('fen') != board.fen() or not analysis.get('top_moves'):
+        return None
+    if analysis.get('depth', 0) < TUTOR_MIN_DEPTH and analysis.get('source', 'engine') == 'engine':
+        return None
+    return analysis
+
+def sse(payload, event=None):
+    """Formats one Server-Sent Event with a JSON payload."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n"
+
+@app.route('/analysis/stream')
+def analysis_stream():
+    """Streams depth-by-depth analysis of the current position as Server-Sent Events.
+
+    Each event carries the score, depth, nodes and top lines in SAN once every
+    line has been searched to a new depth. The search stops when the client
+    disconnects, the game's position changes or STREAM_TIME_LIMIT is reached.
+    """
+    board = current_board()
+    game_id = get_game_id()
+    fen = board.fen()
+    num_lines = min(3, board.legal_moves.count())
+
+    def generate():
+        if num_lines == 0:
+            yield sse({"fen": fen, "message": "No legal moves"}, event="done")
+            return
+
+        if PONDER_MODE and ponderer.is_pondering(game_id, fen):
+            # Follow the game's ponder search instead of starting another one
+            depth = 0
+            deadline = time.monotonic() + STREAM_TIME_LIMIT
+            while is_current_position(game_id, fen):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                entry = ponderer.wait_for(game_id, fen, depth + 1, timeout=min(1.0, remaining))
+                if entry is not None and entry["depth"] > depth:
+                    depth = entry["depth"]
+                    analysis = format_engine_analysis(board, entry)
+                    yield sse({
+                        "fen": fen,
+                        "depth": depth,
+                        "nodes": entry["nodes"],
+                        "score": analysis["best_score"],
+                        "lines": analysis["top_moves"]
+                    })
+                elif not ponderer.is_pondering(game_id, fen):
+                    break
+            yield sse({"fen": fen}, event="done")
+            return
+
+        infos = []
+        try:
+            with engine_pool.checkout(affinity=game_id, priority=priority_class("stream")) as engine:
+                with engine.analysis(board, chess.engine.Limit(time=STREAM_TIME_LIMIT), multipv=num_lines,
+                                     game=engine_pool.game_token(engine)) as analysis:
+                    for info in analysis:
+                        if not is_current_position(game_id, fen):
+                            break
+                        # Only report once the last line has reached the new depth
+                        if info.get("multipv", 1) != num_lines or "pv" not in info:
+                            continue
+
+                        infos = analysis.multipv
+                        lines = [{
+                            "score": format_score(line_info["score"].white()),
+                            "move_line": format_move_line(board, [move.uci() for move in line_info.get("pv", [])])
+                        } for line_info in infos if "score" in line_info]
+                        yield sse({
+                            "fen": fen,
+                            "depth": info.get("depth", 0),
+                            "nodes": info.get("nodes", 0),
+                            "score": lines[0]["score"] if lines else "N/A",
+                            "lines": lines
+                        })
+        except EnginePoolTimeout as e:
+            yield sse({"fen": fen, "message": str(e)}, event="done")
+            return
+        finally:
+            # Keep the deepest result for later requests (also on client disconnect)
+            if infos:
+                analysis_cache.put(board, entry_from_infos(infos))
+
+        yield sse({"fen": fen}, event="done")
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/review', methods=['GET', 'POST'])
+def review():
+    """Reviews a whole game, streaming each ply's result as Server-Sent Events.
+
+    POST a JSON `{"pgn": "..."}` to review a PGN (its mainline, from its FEN
+    header if any); without one the session's moves are reviewed.
+    Every position is analysed in parallel across the engine pool. Each ply
+    event carries the eval after the move, the engine's best move and the
+    classification (inaccuracy, mistake or blunder); a final `done` event
+    carries the per-side summary and the analytics series for the eval graph.
+    """
+    data = request.get_json(silent=True) or {}
+    if data.get('pgn') is not None and not isinstance(data['pgn'], str):
+        return jsonify({'success': False, 'message': 'pgn must be a string'}), 400
+    if data.get('pgn'):
+        parsed = from_pgn(data['pgn'])
+        if parsed is None:
+            return jsonify({'success': False, 'message': 'Invalid PGN'}), 400
+        board, moves = parsed
+    else:
+        board = current_board()
+        board, moves = board.root(), board.move_stack
+
+    if len(moves) > REVIEW_MAX_PLIES:
+        return jsonify({'success': False, 'message': f'Games longer than {REVIEW_MAX_PLIES} plies cannot be reviewed'}), 400
+
+    # Fair-queued under the session's game, so a long review cannot crowd out other sessions' reviews
+    game_id = get_game_id()
+    game_review = GameReview(board, moves, lambda position: analyse_position(position, multipv=1, call_site="review",
+                                                                             tenant=game_id),
+                             max_workers=ENGINE_POOL_SIZE)
+
+    def generate():
+        yield sse({"plies": game_review.plies, "fen": board.fen()}, event="start")
+        results = []
+        for result in game_review.results():
+            entry = result.pop("entry")
+            if entry and entry["lines"]:
+                result["eval_text"] = format_score(line_score(entry["lines"][0]))
+            else:
+                result["eval_text"] = get_game_status(chess.Board(result["fen"])) if result["eval"] is not None else "N/A"
+            results.append(result)
+            yield sse(result)
+
+        results.sort(key=lambda result: result["ply"])
+        evals = [results[0]["best_eval"]] + [result["eval"] for result in results] if results else []
+        yield sse({
+            "summary": summarize(results),
+            "analytics": analyse_game(evals, white_first=board.turn == chess.WHITE)
+        }, event="done")
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/move_heatmap')
+def get_move_heatmap():
+    """Scores every legal move of the current position for the board UI.
+
+    Each move carries its White-relative score and `loss`, the centipawns it
+    loses against the best move for the side to move (0 for the best move,
+    never negative).
+    Results are cached per position, so repeated requests cost nothing.
+    """
+    board = current_board()
+    try:
+        entry = move_heatmap.entry(board)
+    except (EnginePoolTimeout, chess.engine.EngineError) as e:
+        app.logger.error(f"Move heatmap failed: {e}")
+        return jsonify({'success': False, 'message': 'Engine busy, try again'}), 503
+
+    moves = []
+    if entry is not None:
+        losses = score_losses(board, entry)
+        for line in entry["lines"]:
+            move = chess.Move.from_uci(line["pv"][0])
+            moves.append({
+                "uci": move.uci(),
+                "san": board.san(move),
+                "from": chess.square_name(move.from_square),
+                "to": chess.square_name(move.to_square),
+                "score": format_score(line_score(line)),
+                "loss": losses[move.uci()]
+            })
+    return jsonify({'success': True, 'fen': board.fen(), 'depth': entry["depth"] if entry else 0, 'moves': moves})
+
+@app.route('/game_analytics', methods=['POST'])
+def game_analytics():
+    """Computes eval-series analytics for a batch of already reviewed games.
+
+    Expects `{"games": [[eval, ...], ...]}` with each game's White-relative
+    centipawn evals (null when missing), starting with the initial position,
+    and optionally `"white_first": [bool, ...]`. Thousands of games can be
+    sent in one call, e.g. for weekly reports.
+    """
+    data = request.get_json(silent=True) or {}
+    games = data.get('games')
+    if not isinstance(games, list) or not all(isinstance(evals, list) for evals in games):
+        return jsonify({'success': False, 'message': 'Expected "games": a list of eval lists'}), 400
+    white_first = data.get('white_first')
+    if white_first is not None and (not isinstance(white_first, list) or len(white_first) != len(games)
+                                    or not all(isinstance(flag, bool) for flag in white_first)):
+        return jsonify({'success': False, 'message': '"white_first" must be a list of booleans, one per game'}), 400
+
+    try:
+        results = analyse_games(games, white_first=white_first)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'message': f'Invalid evals: {e}'}), 400
+    return jsonify({'success': True, 'games': results})
+
+@app.route('/health')
+def health():
+    """Reports engine state published by the pool supervisor and worker heartbeats (503 when no engine is up)."""
+    engine_health = engine_pool.health()
+    if remote_engines is not None:
+        engine_health["workers"] = remote_engines.metrics()["workers"]
+    no_workers = remote_engines is None or not remote_engines.available
+    status_code = 503 if engine_health["status"] == "down" and no_workers else 200
+    return jsonify(engine_health), status_code
+
+@app.route('/engine_stats')
+def engine_stats():
+    """Reports engine pool utilisation, queue-wait and analysis cache metrics."""
+    return jsonify({
+        'engine_pool': engine_pool.metrics(),
+        'analysis_cache': analysis_cache.metrics(),
+        'prefetcher': prefetcher.metrics(),
+        'eval_jobs': eval_jobs.metrics(),
+        'opening_book': opening_book.metrics() if opening_book else None,
+        'tablebase': tablebase.metrics() if tablebase else None,
+        'move_heatmap': move_heatmap.metrics(),
+        'ponder': ponderer.metrics(),
+        'singleflight': singleflight.metrics(),
+        'engine_workers': remote_engines.metrics() if remote_engines else None,
+        'sessions': session_store.metrics() if session_store else None,
+        'live_games': live_games.metrics(),
+        'analysis_budget': analysis_budget.metrics()
+    })
+
 @app.route('/ask_tutor', methods=['POST'])
 def ask_tutor():
     app.logger.info("Generating tutor response...")
@@ -364,12 +1212,29 @@ def ask_tutor():
     user_message = data.get('message', '')
     
     # Load current board state
-    board = chess.Board(session['board_fen'])
-    move_history = session.get('move_history', [])
+    with live_game() as game:
+        board = game.board.copy()
+        game_status = get_game_status(game.board, game)
+        move_history = list(game.sans)
     turn = "White" if board.turn == chess.WHITE else "Black"
 
-    # Get current engine analysis
-    current_engine_analysis = get_engine_analysis(board)
+    # Reuse the analysis computed at move time, re-searching only if it is missing or too shallow
+    current_engine_analysis = stored_engine_analysis(board)
+    # A running ponder search has usually gone deeper than anything stored
+    pondered = pondered_analysis(board)
+    if pondered is not None and pondered["top_moves"] and (
+            current_engine_analysis is None or pondered["depth"] >= current_engine_analysis.get("depth", 0)):
+        current_engine_analysis = pondered
+    if current_engine_analysis is None:
+        # The move-time eval job may still be running for this position
+        current_engine_analysis = finished_eval_job_analysis(board, wait=EVAL_JOB_MAX_WAIT)
+        if current_engine_analysis is not None and current_engine_analysis.get('depth', 0) < TUTOR_MIN_DEPTH:
+            current_engine_analysis = None
+    if current_engine_analysis is None:
+        current_engine_analysis = get_engine_analysis(board, min_depth=TUTOR_MIN_DEPTH, call_site="tutor",
+                                                      affinity=get_game_id())
+        if current_engine_analysis.get("top_moves"):
+            session['engine_analysis'] = dict(current_engine_analysis, fen=board.fen())
 
     # Ensure engine analysis is available
     if not current_engine_analysis or "top_moves" not in current_engine_analysis:
@@ -395,6 +1260,34 @@ def ask_tutor():
     engine_suggestions_str = "\n".join(engine_suggestions_list)
     engine_best_score_str = current_engine_analysis.get("best_score", "N/A")
 
+    if current_engine_analysis.get("source") == "tablebase":
+        engine_section_str = f"""# Endgame Tablebase Analysis (exact result - Top 3):<br>
+## This endgame is solved by the SYZYGY TABLEBASE. The result below is exact with perfect play (DTZ = moves until the next capture or pawn move).<br>
+## Result: {engine_best_score_str}<br>
+## Top 3 BEST MOVE LINES below:<br>
+{engine_suggestions_str}"""
+    elif current_engine_analysis.get("source") == "book":
+        engine_section_str = f"""# Opening Book Analysis (standard theory - Top 3):<br>
+## This position is in the OPENING BOOK. The lines below are the most played BOOK MOVES (with their share of games), not engine lines. Explain the opening ideas behind them.<br>
+## Position Score: {engine_best_score_str}<br>
+## Top 3 BOOK MOVE LINES below:<br>
+{engine_suggestions_str}"""
+    else:
+        engine_section_str = f"""# Chess Engine Analysis (Stockfish depth {current_engine_analysis.get("depth", "N/A")} - Top 3):<br>
+## Stockfish Chess Engine gives the BEST MOVES. ALWAYS stick to these moves (especially top Line-1 moves) as advice (UNLESS USERS SPECIFIES OTHERWISE).<br>
+## Best Move Score: {engine_best_score_str} (Score relative to White: + favors White, - favors Black. M=Mate)<br>
+## Top 3 BEST MOVE LINES below (Higher Scores are better for white):<br>
+{engine_suggestions_str}"""
+
+    # Answer "what if I play X?" from the move heatmap when the student has looked at it
+    heatmap_entry = move_heatmap.cache.peek(board)
+    if heatmap_entry is not None:
+        move_scores = [f"{board.san(chess.Move.from_uci(line['pv'][0]))} ({format_score(line_score(line))})"
+                       for line in heatmap_entry["lines"] if line["pv"]]
+        engine_section_str += f"""<br>
+## Every legal move, best first (Stockfish depth {heatmap_entry["depth"]}):<br>
+{", ".join(move_scores)}<br>"""
+
     board_unicode = board.unicode()
     board_rows = board_unicode.split('\n')
     board_rows = board_rows[::-1]
@@ -424,7 +1317,8 @@ DO NOT TALK about `Stockfish` or `chess engine evaluation scores` unless users a
 <br><br>
 # Current Game State:<br>
 - {turn} to move
-- Status: {get_game_status(board)}
+- Status: {game_status}
+- Halfmove clock (50-move rule): {board.halfmove_clock}
 
 <br><br>
 # Board:<br>
@@ -447,11 +1341,7 @@ Whenever looking at where a particular piece is, check with this board unicode.
 - ⭘ = empty square
 
 <br><br>
-# Chess Engine Analysis (Stockfish ~{ANALYSIS_TIME_LIMIT}s - Top 3):<br>
-## Stockfish Chess Engine gives the BEST MOVES. ALWAYS stick to these moves (especially top Line-1 moves) as advice (UNLESS USERS SPECIFIES OTHERWISE).<br>
-## Best Move Score: {engine_best_score_str} (Score relative to White: + favors White, - favors Black. M=Mate)<br>
-## Top 3 BEST MOVE LINES below (Higher Scores are better for white):<br>
-{engine_suggestions_str}<br><br>
+{engine_section_str}<br><br>
 
 ---
 <br><br>
@@ -527,6 +1417,58 @@ Do not just repeat the engine moves; offer explanations and alternatives.
             'message': f"Error: {str(e)}"
         })
 
+@app.cli.command("warm-store")
+@click.argument("pgn_path")
+@click.option("--max-plies", default=30, show_default=True, help="Only analyse the first N plies of each game.")
+@click.option("--max-games", default=0, help="Stop after N games (0 = all).")
+def warm_store(pgn_path, max_plies, max_games):
+    """Pre-populates the persistent analysis store from the games in a PGN file."""
+    if analysis_store is None:
+        raise click.ClickException("ANALYSIS_STORE_PATH is not set.")
+    if not engine_pool.available:
+        raise click.ClickException(f"No Stockfish engine available at {STOCKFISH_PATH}.")
+
+    # Collect each new position once, across all games
+    boards, seen, games = [], set(), 0
+    with open(pgn_path) as pgn:
+        while max_games == 0 or games < max_games:
+            game = chess.pgn.read_game(pgn)
+            if game is None:
+                break
+            games += 1
+            board = game.board()
+            for ply, move in enumerate(game.mainline_moves()):
+                if ply >= max_plies:
+                    break
+                epd = position_epd(board)
+                if epd not in seen and not analysis_store.contains(epd):
+                    seen.add(epd)
+                    boards.append(board.copy(stack=False))
+                board.push(move)
+
+    click.echo(f"Analysing {len(boards)} new positions from {games} games on {ENGINE_POOL_SIZE} engines...")
+
+    def warm(board):
+        try:
+            analyse_position(board, multipv=3, call_site="review")
+            return True
+        except Exception as e:
+            app.logger.info(f"Warm-up analysis failed for {board.fen()}: {e}")
+            return False
+
+    analysed = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=ENGINE_POOL_SIZE) as executor:
+        for done, ok in enumerate(executor.map(warm, boards), 1):
+            analysed += ok
+            if done % 100 == 0:
+                click.echo(f"  {done}/{len(boards)} positions")
+
+    analysis_store.flush()
+    click.echo(f"Stored {analysed} positions in {ANALYSIS_STORE_PATH}.")
+
+    # Engine threads would otherwise keep the CLI process alive
+    close_engine()
+
 if __name__ == '__main__':
     # webbrowser.open_new('http://127.0.0.1:2000/')
     # app.run(debug=True, port=2000)
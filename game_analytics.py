@@ -0,0 +1,141 @@
+"""Vectorized analytics over the eval series of reviewed games.
+
+Every metric is computed with NumPy over a (games x positions) array padded
+with NaN, so a batch of thousands of games costs a handful of array
+operations instead of a Python loop per move.
+"""
+import numpy as np
+
+# Mate scores are clamped like format_score(), which uses mate_score=10000
+MATE_SCORE = 10000
+
+# Centipawn loss per move is capped so one missed mate does not dominate the average
+MAX_CENTIPAWN_LOSS = 1000
+
+# Logistic fit of win probability against centipawns (as used by Lichess)
+WIN_PROBABILITY_SLOPE = 0.00368208
+
+# A move that shifts the mover's win probability by this many points is a swing
+SWING_THRESHOLD = 20.0
+
+
+def eval_matrix(eval_series):
+    """Stacks White-relative eval series of different lengths into a NaN-padded float array.
+
+    Each series holds the eval of every position of a game, starting with the
+    position before the first move; None marks a missing eval.
+    """
+    width = max((len(series) for series in eval_series), default=0)
+    evals = np.full((len(eval_series), width), np.nan)
+    for row, series in enumerate(eval_series):
+        evals[row, :len(series)] = [np.nan if value is None else value for value in series]
+    return np.clip(evals, -MATE_SCORE, MATE_SCORE)
+
+
+def win_probability(evals):
+    """Converts White-relative centipawns to White's win probability in percent."""
+    return 50 + 50 * (2 / (1 + np.exp(-WIN_PROBABILITY_SLOPE * evals)) - 1)
+
+
+def move_accuracy(win_probability_loss):
+    """Accuracy (0-100) of moves from the mover's win-probability loss, Lichess-style."""
+    return np.clip(103.1668 * np.exp(-0.04354 * win_probability_loss) - 3.1669, 0, 100)
+
+
+def analyse_games(eval_series, white_first=None, critical_moments=5):
+    """Returns analytics for a batch of games, one dict per game.
+
+    `white_first` optionally lists, per game, whether White made the first
+    move (games loaded from a FEN may start with Black). Each result holds the
+    clamped eval and win-probability series, per-move centipawn loss and
+    accuracy, per-side averages, the plies where the game swung and the
+    `critical_moments` largest swings.
+    """
+    evals = eval_matrix(eval_series)
+    games, width = evals.shape
+    if games == 0 or width < 2:
+        return [_empty_result(evals[row]) for row in range(games)]
+
+    lengths = np.array([len(series) for series in eval_series])
+    white_first = np.ones(games, dtype=bool) if white_first is None else np.asarray(white_first, dtype=bool)
+
+    # Sign that turns White-relative values into the mover's point of view for each ply
+    plies = np.arange(width - 1)
+    white_moves = (plies[None, :] % 2 == 0) == white_first[:, None]
+    mover_sign = np.where(white_moves, 1.0, -1.0)
+    valid = plies[None, :] < (lengths[:, None] - 1)
+
+    capped = np.clip(evals, -MAX_CENTIPAWN_LOSS, MAX_CENTIPAWN_LOSS)
+    centipawn_loss = np.maximum(0, mover_sign * (capped[:, :-1] - capped[:, 1:]))
+    centipawn_loss[~valid] = np.nan
+
+    win_prob = win_probability(evals)
+    win_prob_delta = mover_sign * (win_prob[:, 1:] - win_prob[:, :-1])
+    win_prob_delta[~valid] = np.nan
+    accuracy = move_accuracy(np.maximum(0, -win_prob_delta))
+    swings = np.abs(win_prob_delta)
+
+    per_side = {}
+    for side, mask in (("white", white_moves), ("black", ~white_moves)):
+        per_side[side] = {
+            "average_loss": _nanmean(np.where(mask, centipawn_loss, np.nan)),
+            "accuracy": _nanmean(np.where(mask, accuracy, np.nan)),
+        }
+
+    # Critical moments: the largest swings, ranked per game (NaN sorts last)
+    ranked = np.argsort(np.where(np.isnan(swings), -1, -swings), axis=1)[:, :critical_moments]
+
+    results = []
+    for row in range(games):
+        moves = max(lengths[row] - 1, 0)
+        row_swings = swings[row, :moves]
+        results.append({
+            "evals": _series(evals[row, :lengths[row]]),
+            "win_probability": _series(win_prob[row, :lengths[row]], 1),
+            "centipawn_loss": _series(centipawn_loss[row, :moves]),
+            "accuracy": _series(accuracy[row, :moves], 1),
+            "white": {key: _round(values[row]) for key, values in per_side["white"].items()},
+            "black": {key: _round(values[row]) for key, values in per_side["black"].items()},
+            "swings": np.flatnonzero(row_swings >= SWING_THRESHOLD).tolist(),
+            "critical_moments": [
+                {"ply": int(ply), "swing": round(float(swings[row, ply]), 1)}
+                for ply in ranked[row] if ply < moves and not np.isnan(swings[row, ply])
+            ],
+        })
+    return results
+
+
+def analyse_game(evals, white_first=True, critical_moments=5):
+    """Returns the analytics of one game's eval series."""
+    return analyse_games([evals], [white_first], critical_moments)[0]
+
+
+def _nanmean(values):
+    """Row-wise mean ignoring NaN; NaN for rows without any value (no warning)."""
+    counts = np.sum(~np.isnan(values), axis=1)
+    totals = np.nansum(values, axis=1)
+    return np.divide(totals, counts, out=np.full(totals.shape, np.nan), where=counts > 0)
+
+
+def _series(values, decimals=0):
+    rounded = np.round(values, decimals).tolist()
+    return [None if value != value else (value if decimals else int(value)) for value in rounded]
+
+
+def _round(value, decimals=0):
+    if np.isnan(value):
+        return None
+    return round(float(value), decimals) if decimals else int(round(float(value)))
+
+
+def _empty_result(evals):
+    return {
+        "evals": _series(evals),
+        "win_probability": _series(win_probability(evals), 1),
+        "centipawn_loss": [],
+        "accuracy": [],
+        "white": {"average_loss": None, "accuracy": None},
+        "black": {"average_loss": None, "accuracy": None},
+        "swings": [],
+        "critical_moments": [],
+    }
@@ -0,0 +1,58 @@
+"""Compact binary encoding of games for sessions.
+
+`encode_moves` packs each move's from, to and promotion squares into 2
+bytes. Decoding needs no move generation, so boards can be rebuilt from it
+on every request. `to_pgn` and `from_pgn` convert move stacks to and from PGN.
+"""
+import base64
+import io
+import struct
+
+import chess
+import chess.pgn
+
+
+def pack_move(move):
+    """Packs a move into 16 bits: from square, to square and promotion piece type."""
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def unpack_move(value):
+    """Inverse of `pack_move`."""
+    return chess.Move(value & 0x3F, (value >> 6) & 0x3F, promotion=(value >> 12) or None)
+
+
+def encode_moves(moves):
+    """Encodes moves with 2 bytes each."""
+    moves = list(moves)
+    return struct.pack(f"<{len(moves)}H", *map(pack_move, moves))
+
+
+def decode_moves(data):
+    """Decodes `encode_moves` output into a list of moves."""
+    return [unpack_move(value) for value in struct.unpack(f"<{len(data) // 2}H", data)]
+
+
+def to_text(data):
+    """Encodes bytes for JSON contexts such as the session."""
+    return base64.b64encode(data).decode("ascii")
+
+
+def from_text(text):
+    return base64.b64decode(text)
+
+
+def to_pgn(board, headers=None):
+    """Returns the PGN of a board's move stack, from its start position."""
+    game = chess.pgn.Game.from_board(board)
+    for name, value in (headers or {}).items():
+        game.headers[name] = value
+    return str(game)
+
+
+def from_pgn(pgn):
+    """Returns `(board, moves)`: the start position and mainline moves of a PGN, or None if unreadable."""
+    game = chess.pgn.read_game(io.StringIO(pgn))
+    if game is None or game.errors:
+        return None
+    return game.board(), list(game.mainline_moves())
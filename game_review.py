@@ -0,0 +1,141 @@
+"""Full-game review: per-ply evaluation, best move and move classification."""
+import concurrent.futures
+import logging
+
+import chess
+
+from analysis_cache import line_score
+from game_analytics import MATE_SCORE, MAX_CENTIPAWN_LOSS
+
+logger = logging.getLogger(__name__)
+
+# Centipawns lost by the mover compared to the engine's best move, largest first
+CLASSIFICATIONS = ((300, "blunder"), (100, "mistake"), (50, "inaccuracy"))
+
+
+def classify(loss):
+    """Returns "blunder", "mistake", "inaccuracy" or None for a centipawn loss."""
+    for threshold, classification in CLASSIFICATIONS:
+        if loss >= threshold:
+            return classification
+    return None
+
+
+def position_value(board, entry):
+    """Returns the White-relative centipawn value of a position, mates clamped to MATE_SCORE.
+
+    Finished games are scored from the result; None if the analysis failed.
+    """
+    if board.is_checkmate():
+        return -MATE_SCORE if board.turn == chess.WHITE else MATE_SCORE
+    if board.is_game_over():
+        return 0
+    if entry is None or not entry["lines"]:
+        return None
+    value = line_score(entry["lines"][0]).score(mate_score=MATE_SCORE)
+    return max(-MATE_SCORE, min(MATE_SCORE, value))
+
+
+class GameReview:
+    """Analyses every position of a game in parallel and reports each ply as soon as it can.
+
+    A ply needs the analysis of the positions before and after its move, so
+    results arrive roughly in order but not strictly: iterate `results()` and
+    use each result's `ply` to place it.
+    """
+
+    def __init__(self, board, moves, analyse, max_workers=2):
+        self.boards = [board.copy(stack=False)]
+        self.moves = []
+        self.sans = []
+        for move in moves:
+            self.sans.append(self.boards[-1].san(move))
+            self.moves.append(move)
+            next_board = self.boards[-1].copy(stack=False)
+            next_board.push(move)
+            self.boards.append(next_board)
+        self.analyse = analyse
+        self.max_workers = max(1, max_workers)
+        self._entries = {}
+
+    @property
+    def plies(self):
+        return len(self.moves)
+
+    def results(self):
+        """Yields one result dict per ply, in completion order."""
+        if not self.moves:
+            return
+
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="game-review")
+        try:
+            # Submitted in game order so early plies complete first
+            futures = {executor.submit(self._analyse, board): index for index, board in enumerate(self.boards)}
+            for future in concurrent.futures.as_completed(futures):
+                index = futures[future]
+                self._entries[index] = future.result()
+                # Position `index` completes the ply leading to it and the ply leaving it
+                for ply in (index - 1, index):
+                    if 0 <= ply < self.plies and ply in self._entries and ply + 1 in self._entries:
+                        yield self._ply_result(ply)
+        finally:
+            # Also reached when a streaming client disconnects mid-review
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _analyse(self, board):
+        if board.is_game_over():
+            return None
+        try:
+            return self.analyse(board)
+        except Exception as e:
+            logger.info(f"Review analysis failed for {board.fen()}: {e}")
+            return None
+
+    def _ply_result(self, ply):
+        board, move = self.boards[ply], self.moves[ply]
+        entry_before, entry_after = self._entries[ply], self._entries[ply + 1]
+        value_before = position_value(board, entry_before)
+        value_after = position_value(self.boards[ply + 1], entry_after)
+
+        best_move = None
+        if entry_before and entry_before["lines"] and entry_before["lines"][0]["pv"]:
+            best_move = chess.Move.from_uci(entry_before["lines"][0]["pv"][0])
+
+        loss = None
+        if best_move == move:
+            loss = 0
+        elif value_before is not None and value_after is not None:
+            sign = 1 if board.turn == chess.WHITE else -1
+            # Capped so that missing a mate counts like losing a big material edge
+            before, after = (max(-MAX_CENTIPAWN_LOSS, min(MAX_CENTIPAWN_LOSS, value)) for value in (value_before, value_after))
+            loss = max(0, sign * (before - after))
+
+        return {
+            "ply": ply,
+            "move_number": board.fullmove_number,
+            "color": "white" if board.turn == chess.WHITE else "black",
+            "move": self.sans[ply],
+            "uci": move.uci(),
+            "fen": self.boards[ply + 1].fen(),
+            "eval": value_after,
+            "entry": entry_after,
+            "best_move": board.san(best_move) if best_move and board.is_legal(best_move) else None,
+            "best_eval": value_before,
+            "loss": loss,
+            "classification": "best" if loss == 0 and best_move == move else (classify(loss) if loss is not None else None),
+        }
+
+
+def summarize(results):
+    """Counts classifications and the average centipawn loss of each side."""
+    summary = {}
+    for color in ("white", "black"):
+        plies = [result for result in results if result["color"] == color]
+        losses = [result["loss"] for result in plies if result["loss"] is not None]
+        summary[color] = {
+            "moves": len(plies),
+            "average_loss": round(sum(losses) / len(losses)) if losses else None,
+        }
+        for _, classification in CLASSIFICATIONS:
+            summary[color][classification] = sum(result["classification"] == classification for result in plies)
+    return summary
@@ -0,0 +1,91 @@
+"""Incremental repetition, draw-rule and SAN tracking for a live game."""
+import collections
+
+import chess
+
+from analysis_cache import position_key
+
+
+class GameState:
+    """A board plus an occurrence counter of every position of the game.
+
+    `push()` and `pop()` keep the counter, and the SAN of every move in
+    `sans`, in step with the board, so repetition and move-rule checks are
+    O(1) and the move history is never rebuilt by replaying the move stack. Positions are keyed like the analysis cache (Zobrist hash, side to
+    move, castling rights and legal en passant), which is what the repetition
+    rules compare.
+    """
+
+    def __init__(self, board=None):
+        self.board = board.copy() if board is not None else chess.Board()
+        self._counts = collections.Counter()
+        self.sans = []
+        # One replay to count the positions (and name the moves) already on the move stack
+        replay = self.board.root()
+        self.start_fen = replay.fen()
+        self._counts[position_key(replay)] += 1
+        for move in self.board.move_stack:
+            self.sans.append(replay.san(move))
+            replay.push(move)
+            self._counts[position_key(replay)] += 1
+
+    def push(self, move):
+        """Plays a move and returns its SAN."""
+        san = self.board.san(move)
+        self.board.push(move)
+        self._counts[position_key(self.board)] += 1
+        self.sans.append(san)
+        return san
+
+    def pop(self):
+        key = position_key(self.board)
+        self._counts[key] -= 1
+        if not self._counts[key]:
+            del self._counts[key]
+        self.sans.pop()
+        return self.board.pop()
+
+    def repetitions(self):
+        """How often the current position has occurred in the game, this time included."""
+        return self._counts[position_key(self.board)]
+
+    def is_fivefold_repetition(self):
+        return self.repetitions() >= 5
+
+    def can_claim_threefold_repetition(self):
+        """True if the current position has occurred three times."""
+        return self.repetitions() >= 3
+
+    def is_seventyfive_moves(self):
+        # Checkmate on the 75th move takes precedence, see game_over()
+        return self.board.halfmove_clock >= 150
+
+    def can_claim_fifty_moves(self):
+        return self.board.halfmove_clock >= 100
+
+    def termination(self):
+        """Returns why the game is over ("checkmate", "stalemate", "insufficient_material",
+        "seventyfive_moves" or "fivefold_repetition"), or None while it goes on."""
+        if self.board.is_checkmate():
+            return "checkmate"
+        if self.board.is_stalemate():
+            return "stalemate"
+        if self.board.is_insufficient_material():
+            return "insufficient_material"
+        if self.is_seventyfive_moves():
+            return "seventyfive_moves"
+        if self.is_fivefold_repetition():
+            return "fivefold_repetition"
+        return None
+
+    def is_game_over(self):
+        return self.termination() is not None
+
+    def claimable_draws(self):
+        """Names of the draws the side to move may claim."""
+        claims = []
+        if self.can_claim_threefold_repetition():
+            claims.append("threefold repetition")
+        if self.can_claim_fifty_moves():
+            claims.append("50-move rule")
+        return claims
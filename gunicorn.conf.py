@@ -0,0 +1,23 @@
+"""Production serving: `gunicorn -c gunicorn.conf.py flask_chess:app`.
+
+Pre-fork model: the app is imported in each worker after the fork (no
+preload), so every worker starts its own Stockfish pool and threads. Workers
+share sessions and analysis through the SQLite stores on the host.
+"""
+import os
+
+workers = int(os.environ.get("WEB_WORKERS", os.cpu_count() or 1))
+# The app sizes its engine pool and picks a shared session backend from this
+os.environ["WEB_WORKERS"] = str(workers)
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Threads for long-polls (/eval_job) and Server-Sent Event streams
+worker_class = "gthread"
+threads = int(os.environ.get("WEB_THREADS", 8))
+
+preload_app = False
+
+# Full-game reviews stream for longer than the default 30s
+timeout = 300
+graceful_timeout = 30
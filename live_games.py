@@ -0,0 +1,107 @@
+"""In-memory registry of live games: each game's board with its full move stack and repetition counts."""
+import collections
+import contextlib
+import threading
+
+import chess
+
+from game_codec import decode_moves, encode_moves
+from game_state import GameState
+
+
+class LiveGames:
+    """LRU registry of live games (GameState objects) keyed by game id.
+
+    A game's board keeps its whole move stack, so undo is a single `pop()`,
+    and its GameState answers repetition and move-rule checks in O(1). The
+    session's move list (2 bytes per move, see game_codec.py) stays the
+    source of truth: a board that was evicted, or that no longer matches the
+    move list (e.g. the session was served by another process), is rebuilt
+    from it without SAN parsing.
+
+    Mutate a game only inside `with live_games.game(...) as game:`, which
+    holds the game's lock; readers take a `snapshot()` copy of the board instead.
+    """
+
+    def __init__(self, max_games=10000):
+        self.max_games = max(1, max_games)
+        self._games = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.rehydrations = 0
+        self.evictions = 0
+
+    @contextlib.contextmanager
+    def game(self, game_id, moves, start_fen=None):
+        """Yields the game's live GameState, locked, rebuilt from `moves` if needed.
+
+        `start_fen` is the game's start position when it is not the standard one.
+        """
+        live = self._get(game_id)
+        with live["lock"]:
+            game = live["game"]
+            if game is None or not _matches(game, moves, start_fen):
+                game = live["game"] = rehydrate(moves, start_fen)
+                self.rehydrations += 1
+            else:
+                self.hits += 1
+            yield game
+
+    def snapshot(self, game_id, moves, start_fen=None):
+        """Returns a copy of the game's board (with its move stack) for read-only use."""
+        with self.game(game_id, moves, start_fen) as game:
+            return game.board.copy()
+
+    def reset(self, game_id, board=None):
+        """Starts the game over from `board` (the standard start position by default)."""
+        live = self._get(game_id)
+        with live["lock"]:
+            live["game"] = GameState(board)
+
+    def discard(self, game_id):
+        with self._lock:
+            self._games.pop(game_id, None)
+
+    def _get(self, game_id):
+        with self._lock:
+            live = self._games.get(game_id)
+            if live is None:
+                live = self._games[game_id] = {"game": None, "lock": threading.Lock()}
+            self._games.move_to_end(game_id)
+            while len(self._games) > self.max_games:
+                self._games.popitem(last=False)
+                self.evictions += 1
+            return live
+
+    def __len__(self):
+        return len(self._games)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "games": len(self._games),
+                "max_games": self.max_games,
+                "hits": self.hits,
+                "rehydrations": self.rehydrations,
+                "evictions": self.evictions,
+            }
+
+
+def rehydrate(moves, start_fen=None):
+    """Rebuilds a game from its start position and `encode_moves` output."""
+    game = GameState(chess.Board(start_fen) if start_fen else None)
+    for move in decode_moves(moves):
+        game.push(move)
+    return game
+
+
+def _matches(game, moves, start_fen=None):
+    """True if the game starts at `start_fen` and its move stack is exactly `moves`.
+
+    The whole move list is compared: games of the same length ending with the
+    same move (1.e4 e5 2.Nf3 and 1.d4 e5 2.Nf3) must not share a board.
+    """
+    stack = game.board.move_stack
+    if 2 * len(stack) != len(moves) or game.start_fen != (start_fen or chess.STARTING_FEN):
+        return False
+    return encode_moves(stack) == bytes(moves)
@@ -0,0 +1,69 @@
+"""Scores for every legal move of a position, searched in parallel across the engine pool."""
+import concurrent.futures
+
+import chess
+
+from analysis_cache import AnalysisCache, entry_from_infos, line_score
+from engine_scheduler import priority_class
+from game_analytics import MATE_SCORE
+
+
+class MoveHeatmap:
+    """Evaluates all legal moves of a position and caches the result per position.
+
+    The legal moves are split into one group per engine and each group is
+    searched with `root_moves` and MultiPV set to the group size, so every
+    move gets its own score and the groups run in parallel.
+    """
+
+    def __init__(self, engine_pool, analysis_budget, max_entries=5000, store=None):
+        self.engine_pool = engine_pool
+        self.analysis_budget = analysis_budget
+        # Entries hold one line per legal move, so they get a cache (and store table) of their own
+        self.cache = AnalysisCache(max_entries=max_entries, store=store)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, engine_pool.size), thread_name_prefix="move-heatmap")
+
+    def entry(self, board):
+        """Returns an analysis entry with one line per legal move, best first for the side to move."""
+        moves = list(board.legal_moves)
+        entry = self.cache.get(board, multipv=len(moves))
+        if entry is not None or not moves:
+            return entry
+
+        groups = min(len(moves), max(1, self.engine_pool.size))
+        chunks = [moves[i::groups] for i in range(groups)]
+        limit = self.analysis_budget.limit("heatmap", board)
+        futures = [self._executor.submit(self._search, board, limit, chunk) for chunk in chunks]
+        infos = [info for future in futures for info in future.result()]
+
+        lines = entry_from_infos(infos)["lines"]
+        sign = 1 if board.turn == chess.WHITE else -1
+        lines.sort(key=lambda line: sign * line_score(line).score(mate_score=MATE_SCORE), reverse=True)
+        entry = {
+            # The shallowest group bounds how far every move was searched
+            "depth": min((info.get("depth", 0) for info in infos), default=0),
+            "nodes": sum(info.get("nodes", 0) for info in infos),
+            "multipv": len(lines),
+            "lines": lines,
+        }
+        self.cache.put(board, entry)
+        return entry
+
+    def _search(self, board, limit, root_moves):
+        with self.engine_pool.checkout(priority=priority_class("heatmap")) as engine:
+            return engine.analyse(board, limit, multipv=len(root_moves), root_moves=root_moves,
+                                  game=self.engine_pool.game_token(engine))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def metrics(self):
+        return self.cache.metrics()
+
+
+def score_losses(board, entry):
+    """Returns `{uci: loss}`: centipawns (>= 0) each move loses against the best one, for the side to move."""
+    sign = 1 if board.turn == chess.WHITE else -1
+    values = {line["pv"][0]: sign * line_score(line).score(mate_score=MATE_SCORE) for line in entry["lines"] if line["pv"]}
+    best = max(values.values(), default=0)
+    return {uci: best - value for uci, value in values.items()}
@@ -0,0 +1,71 @@
+"""Polyglot opening book lookups used before asking Stockfish."""
+import threading
+
+import chess
+import chess.polyglot
+
+
+class OpeningBook:
+    """Read-only Polyglot `.bin` book, opened once and shared by all requests."""
+
+    def __init__(self, path):
+        self.path = path
+        self._reader = chess.polyglot.open_reader(path)
+        # MemoryReader lookups are read-only, but keep close() from racing them
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def moves(self, board):
+        """Returns `[(move, weight), ...]` for a position, most played first."""
+        with self._lock:
+            if self._reader is None:
+                return []
+            weights = {}
+            for entry in self._reader.find_all(board, minimum_weight=1):
+                weights[entry.move] = weights.get(entry.move, 0) + entry.weight
+        return sorted(weights.items(), key=lambda item: item[1], reverse=True)
+
+    def contains(self, board):
+        return bool(self.moves(board))
+
+    def lookup(self, board, max_lines=3, line_length=4):
+        """Returns the top book lines of a position, or None when it is out of book.
+
+        Each line starts with one of the most played book moves and follows the
+        most played book reply for up to `line_length` moves. Shares are the
+        move's percentage of the position's total book weight.
+        """
+        moves = self.moves(board)
+        if not moves:
+            self.misses += 1
+            return None
+        self.hits += 1
+
+        total = sum(weight for _, weight in moves)
+        lines = []
+        for move, weight in moves[:max_lines]:
+            pv = [move]
+            temp_board = board.copy(stack=False)
+            temp_board.push(move)
+            while len(pv) < line_length:
+                replies = self.moves(temp_board)
+                if not replies:
+                    break
+                pv.append(replies[0][0])
+                temp_board.push(replies[0][0])
+            lines.append({
+                "pv": [book_move.uci() for book_move in pv],
+                "weight": weight,
+                "share": round(100 * weight / total, 1),
+            })
+        return lines
+
+    def close(self):
+        with self._lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+    def metrics(self):
+        return {"path": self.path, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,165 @@
+"""Continuous per-game analysis of the current position while the user thinks."""
+import collections
+import logging
+import threading
+import time
+
+from analysis_cache import entry_from_infos
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks whether a search should give way or stop
+POLL_INTERVAL = 0.1
+
+
+class Ponderer:
+    """Keeps an infinite search running on the current position of each pondering game.
+
+    `start()` is called whenever a game reaches a new position; it stops that
+    game's previous search and starts a new one on the game's sticky engine.
+    Readers take `snapshot()`s of the deepest complete MultiPV result so far,
+    or block in `wait_for()` until the search is deep enough.
+
+    At most `max_sessions` games ponder at once (the least recently started
+    one is stopped for a newcomer), a search gives way as soon as an
+    interactive request waits for an engine, and none runs longer than
+    `max_time` seconds.
+    """
+
+    def __init__(self, engine_pool, analysis_cache, max_sessions=1, multipv=3, max_time=60.0):
+        self.engine_pool = engine_pool
+        self.analysis_cache = analysis_cache
+        self.max_sessions = max(1, max_sessions)
+        self.multipv = multipv
+        self.max_time = max_time
+        self._sessions = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._updated = threading.Condition(self._lock)
+
+        self.started = 0
+        self.evicted = 0
+        self.preempted = 0
+
+    def start(self, game_id, board):
+        """Starts pondering a game's new position, stopping its previous search."""
+        if board.is_game_over():
+            self.stop(game_id)
+            return
+
+        ponder = {"fen": board.fen(), "board": board.copy(), "stop": threading.Event(), "done": threading.Event(),
+                  "entry": None, "running": True}
+        stopped = []
+        with self._lock:
+            previous = self._sessions.pop(game_id, None)
+            if previous is not None:
+                stopped.append(previous)
+            while len(self._sessions) >= self.max_sessions:
+                _, oldest = self._sessions.popitem(last=False)
+                stopped.append(oldest)
+                self.evicted += 1
+            for stopped_ponder in stopped:
+                stopped_ponder["stop"].set()
+            self._sessions[game_id] = ponder
+            self.started += 1
+            self._updated.notify_all()
+
+        threading.Thread(target=self._run, args=(game_id, ponder, stopped), name="ponder", daemon=True).start()
+
+    def stop(self, game_id):
+        """Stops pondering a game (e.g. on a new game)."""
+        with self._lock:
+            ponder = self._sessions.pop(game_id, None)
+            if ponder is not None:
+                ponder["stop"].set()
+            self._updated.notify_all()
+
+    def is_pondering(self, game_id, fen):
+        """True while a search on `fen` is running for the game."""
+        with self._lock:
+            ponder = self._sessions.get(game_id)
+            return ponder is not None and ponder["fen"] == fen and ponder["running"]
+
+    def snapshot(self, game_id, fen):
+        """Returns the deepest complete analysis entry so far for the game's position, or None."""
+        with self._lock:
+            ponder = self._sessions.get(game_id)
+            if ponder is None or ponder["fen"] != fen:
+                return None
+            return ponder["entry"]
+
+    def wait_for(self, game_id, fen, min_depth, timeout):
+        """Waits up to `timeout` seconds for the position's search to reach `min_depth`.
+
+        Returns the latest snapshot (possibly shallower, or None) once the depth
+        is reached, the search ends or the timeout expires.
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while True:
+                ponder = self._sessions.get(game_id)
+                if ponder is None or ponder["fen"] != fen:
+                    return None
+                entry = ponder["entry"]
+                remaining = deadline - time.monotonic()
+                if (entry is not None and entry["depth"] >= min_depth) or not ponder["running"] or remaining <= 0:
+                    return entry
+                self._updated.wait(remaining)
+
+    def _run(self, game_id, ponder, stopped):
+        # Let the searches this one replaces hand their engines back first
+        for stopped_ponder in stopped:
+            stopped_ponder["done"].wait(timeout=1.0)
+        board = ponder["board"]
+        num_lines = min(self.multipv, board.legal_moves.count())
+        deadline = time.monotonic() + self.max_time
+        try:
+            with self.engine_pool.try_checkout(affinity=game_id) as engine:
+                if engine is None:
+                    # Every engine is busy with interactive work
+                    self.preempted += 1
+                    return
+                game = self.engine_pool.game_token(engine)
+                with engine.analysis(board, multipv=num_lines, game=game) as analysis:
+                    publisher = threading.Thread(target=self._publish, args=(ponder, analysis, num_lines), name="ponder-publish", daemon=True)
+                    publisher.start()
+                    # Deep iterations can go seconds without output, so stop conditions are polled here
+                    while publisher.is_alive() and not ponder["stop"].wait(POLL_INTERVAL):
+                        if time.monotonic() > deadline:
+                            break
+                        if self.engine_pool.contended:
+                            self.preempted += 1
+                            break
+                    analysis.stop()
+                    publisher.join()
+        except Exception as e:
+            logger.info(f"Pondering failed: {e}")
+        finally:
+            with self._lock:
+                ponder["running"] = False
+                self._updated.notify_all()
+            ponder["done"].set()
+            # Keep the deepest result for later requests
+            if ponder["entry"] is not None:
+                self.analysis_cache.put(board, ponder["entry"])
+
+    def _publish(self, ponder, analysis, num_lines):
+        for info in analysis:
+            # Only publish once the last line has reached the new depth
+            if info.get("multipv", 1) != num_lines or "pv" not in info:
+                continue
+            entry = entry_from_infos(analysis.multipv)
+            with self._lock:
+                ponder["entry"] = entry
+                self._updated.notify_all()
+
+    def metrics(self):
+        with self._lock:
+            pondering = [ponder for ponder in self._sessions.values() if ponder["running"]]
+            return {
+                "pondering": len(pondering),
+                "max_sessions": self.max_sessions,
+                "max_depth": max((ponder["entry"]["depth"] for ponder in pondering if ponder["entry"]), default=0),
+                "started": self.started,
+                "evicted": self.evicted,
+                "preempted": self.preempted,
+            }
@@ -0,0 +1,139 @@
+"""Speculative background analysis of the positions likely to come next."""
+import logging
+import queue
+import threading
+
+import chess
+import chess.engine
+
+from analysis_cache import entry_from_infos
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    """Low-priority worker that fills the analysis cache while the user thinks.
+
+    Work is scheduled per game: scheduling a new position for a game cancels
+    whatever was still pending for that game's previous position. The worker
+    only borrows an engine when the pool is idle and stops its search as soon
+    as an interactive request starts waiting for an engine.
+    """
+
+    def __init__(self, engine_pool, analysis_cache, analysis_budget, multipv=3, replies=3):
+        self.engine_pool = engine_pool
+        self.analysis_cache = analysis_cache
+        self.analysis_budget = analysis_budget
+        self.multipv = multipv
+        self.replies = replies
+        self._queue = queue.Queue()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self.scheduled = 0
+        self.completed = 0
+        self.skipped = 0
+        self.preempted = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="prefetcher", daemon=True)
+        self._thread.start()
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stopped.is_set()
+
+    def stop(self):
+        """Stops the worker and drops all pending positions."""
+        self._stopped.set()
+        self._queue.put(None)
+
+    def cancel(self, game_id):
+        """Drops pending work for a game (e.g. after undo or a new game)."""
+        with self._lock:
+            self._generations[game_id] = self._generations.get(game_id, 0) + 1
+
+    def schedule(self, game_id, board):
+        """Queues the positions after the top engine replies and the likely follow-ups.
+
+        Candidates come from the cached PVs of `board`: the position after each
+        of the top replies, then the position after the top line's next move.
+        Nothing is queued unless the worker runs (it is only started with a
+        local engine pool), so the queue cannot grow without a consumer.
+        """
+        if not self.is_running():
+            return
+        entry = self.analysis_cache.peek(board, multipv=1)
+        if entry is None:
+            return
+
+        with self._lock:
+            generation = self._generations.get(game_id, 0) + 1
+            self._generations[game_id] = generation
+
+        candidates = []
+        for line in entry["lines"][:self.replies]:
+            temp_board = board.copy(stack=False)
+            for uci in line["pv"][:2]:
+                move = chess.Move.from_uci(uci)
+                if not temp_board.is_legal(move):
+                    break
+                temp_board.push(move)
+                candidates.append(temp_board.copy(stack=False))
+
+        # Direct replies first, deeper follow-ups after
+        candidates.sort(key=lambda candidate: candidate.ply())
+        for candidate in candidates:
+            self._queue.put((game_id, generation, candidate))
+            self.scheduled += 1
+
+    def _is_current(self, game_id, generation):
+        with self._lock:
+            return self._generations.get(game_id) == generation
+
+    def _run(self):
+        while not self._stopped.is_set():
+            item = self._queue.get()
+            if item is None:
+                break
+            game_id, generation, board = item
+            if not self._is_current(game_id, generation) or board.is_game_over():
+                self.skipped += 1
+                continue
+            if self.analysis_cache.peek(board, multipv=self.multipv) is not None:
+                self.skipped += 1
+                continue
+            try:
+                self._analyse(game_id, generation, board)
+            except Exception as e:
+                logger.info(f"Speculative analysis failed: {e}")
+
+    def _analyse(self, game_id, generation, board):
+        # The game's own engine if idle: the prefetched subtree then stays in its hash table
+        with self.engine_pool.try_checkout(affinity=game_id) as engine:
+            if engine is None:
+                # Engines are busy with interactive work, drop this candidate
+                self.preempted += 1
+                return
+
+            limit = self.analysis_budget.limit("speculative", board)
+            with engine.analysis(board, limit, multipv=self.multipv, game=self.engine_pool.game_token(engine)) as analysis:
+                for _ in analysis:
+                    if self.engine_pool.contended or not self._is_current(game_id, generation):
+                        analysis.stop()
+                        self.preempted += 1
+                        return
+                infos = analysis.multipv
+
+        self.analysis_cache.put(board, entry_from_infos(infos))
+        self.completed += 1
+
+    def metrics(self):
+        return {
+            "pending": self._queue.qsize(),
+            "scheduled": self.scheduled,
+            "completed": self.completed,
+            "skipped": self.skipped,
+            "preempted": self.preempted,
+        }
@@ -0,0 +1,269 @@
+"""Server-side Flask sessions: only a random session id is kept in the cookie.
+
+The session dict is serialized as compact JSON, zlib-compressed when large,
+and kept in a pluggable store with a TTL:
+
+- MemorySessionStore: in-process, for development and single-process deploys.
+- SqliteSessionStore: a local SQLite file shared by the processes of one host.
+- RedisSessionStore: a Redis server (or any Redis-protocol stand-in); needs the
+  optional `redis` package.
+"""
+import collections
+import json
+import logging
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+logger = logging.getLogger(__name__)
+
+# Payloads larger than this (bytes of JSON) are zlib-compressed
+COMPRESS_MIN_SIZE = 512
+
+# First byte of a stored payload: plain or zlib-compressed JSON
+PLAIN, COMPRESSED = b"j", b"z"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    sid TEXT PRIMARY KEY,
+    expires REAL NOT NULL,
+    data BLOB NOT NULL
+)
+"""
+
+
+def dumps(data):
+    """Serializes a session dict to compact JSON bytes, compressed when large.
+
+    Chat replies repeat their text in several fields, which compression
+    stores only once.
+    """
+    payload = json.dumps(data, separators=(",", ":")).encode()
+    if len(payload) >= COMPRESS_MIN_SIZE:
+        return COMPRESSED + zlib.compress(payload)
+    return PLAIN + payload
+
+
+def loads(blob):
+    """Inverse of `dumps`."""
+    blob = bytes(blob)
+    payload = zlib.decompress(blob[1:]) if blob[:1] == COMPRESSED else blob[1:]
+    return json.loads(payload)
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session dict that records whether it was modified during the request."""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask session interface keeping session data in `store` for `ttl` seconds.
+
+    A session is written back only when it was modified; otherwise its TTL is
+    refreshed.
+    """
+
+    def __init__(self, store, ttl=7 * 24 * 3600):
+        self.store = store
+        self.ttl = ttl
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            blob = self.store.load(sid)
+            if blob is not None:
+                try:
+                    return ServerSession(loads(blob), sid=sid)
+                except (ValueError, zlib.error) as e:
+                    logger.info(f"Dropping unreadable session {sid}: {e}")
+        return ServerSession(sid=secrets.token_urlsafe(24), new=True)
+
+    def save_session(self, app, session, response):
+        cookie_name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if session.modified and not session.new:
+                self.store.delete(session.sid)
+                response.delete_cookie(cookie_name, domain=domain, path=path)
+            return
+
+        if session.modified or session.new:
+            self.store.save(session.sid, dumps(dict(session)), self.ttl)
+        else:
+            self.store.touch(session.sid, self.ttl)
+
+        if session.new or self.should_set_cookie(app, session):
+            response.set_cookie(cookie_name, session.sid, max_age=self.ttl, domain=domain, path=path,
+                                httponly=self.get_cookie_httponly(app), secure=self.get_cookie_secure(app),
+                                samesite=self.get_cookie_samesite(app))
+
+
+class MemorySessionStore:
+    """In-process session store with TTL expiry and an LRU size bound."""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.expired = 0
+        self.evictions = 0
+
+    def load(self, sid):
+        with self._lock:
+            item = self._entries.get(sid)
+            if item is None:
+                return None
+            expires, blob = item
+            if expires < time.time():
+                del self._entries[sid]
+                self.expired += 1
+                return None
+            self._entries.move_to_end(sid)
+            return blob
+
+    def save(self, sid, blob, ttl):
+        with self._lock:
+            self._entries[sid] = (time.time() + ttl, blob)
+            self._entries.move_to_end(sid)
+            self._evict()
+
+    def touch(self, sid, ttl):
+        with self._lock:
+            item = self._entries.get(sid)
+            if item is not None:
+                self._entries[sid] = (time.time() + ttl, item[1])
+                self._entries.move_to_end(sid)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def _evict(self):
+        # Least recently used first, so expired sessions are usually at the front
+        now = time.time()
+        while self._entries:
+            sid, (expires, _) = next(iter(self._entries.items()))
+            if expires < now:
+                self.expired += 1
+            elif len(self._entries) > self.max_entries:
+                self.evictions += 1
+            else:
+                break
+            del self._entries[sid]
+
+    def metrics(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._entries),
+                "bytes": sum(len(blob) for _, blob in self._entries.values()),
+                "expired": self.expired,
+                "evictions": self.evictions,
+            }
+
+
+class SqliteSessionStore:
+    """Session store in a SQLite file (one connection per thread), expired rows purged periodically."""
+
+    def __init__(self, path, purge_interval=300.0):
+        self.path = path
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._next_purge = 0.0
+        self.expired = 0
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(SCHEMA)
+        connection.commit()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def load(self, sid):
+        try:
+            row = self._connection().execute("SELECT data FROM sessions WHERE sid = ? AND expires >= ?",
+                                             (sid, time.time())).fetchone()
+        except sqlite3.Error as e:
+            logger.info(f"Session store read failed: {e}")
+            return None
+        return row[0] if row is not None else None
+
+    def save(self, sid, blob, ttl):
+        connection = self._connection()
+        with connection:
+            connection.execute("INSERT OR REPLACE INTO sessions (sid, expires, data) VALUES (?, ?, ?)",
+                               (sid, time.time() + ttl, sqlite3.Binary(blob)))
+        self._purge()
+
+    def touch(self, sid, ttl):
+        connection = self._connection()
+        with connection:
+            connection.execute("UPDATE sessions SET expires = ? WHERE sid = ?", (time.time() + ttl, sid))
+
+    def delete(self, sid):
+        connection = self._connection()
+        with connection:
+            connection.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def _purge(self):
+        now = time.time()
+        if now < self._next_purge:
+            return
+        self._next_purge = now + self.purge_interval
+        try:
+            connection = self._connection()
+            with connection:
+                self.expired += connection.execute("DELETE FROM sessions WHERE expires < ?", (now,)).rowcount
+        except sqlite3.Error as e:
+            logger.info(f"Session store purge failed: {e}")
+
+    def metrics(self):
+        sessions, size = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM sessions").fetchone()
+        return {"backend": "sqlite", "path": self.path, "sessions": sessions, "bytes": size, "expired": self.expired}
+
+
+class RedisSessionStore:
+    """Session store on a Redis server; expiry is left to Redis key TTLs."""
+
+    def __init__(self, url, prefix="chess-tutor:session:"):
+        import redis
+
+        self.url = url
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def load(self, sid):
+        return self._client.get(self.prefix + sid)
+
+    def save(self, sid, blob, ttl):
+        self._client.set(self.prefix + sid, blob, ex=int(ttl))
+
+    def touch(self, sid, ttl):
+        self._client.expire(self.prefix + sid, int(ttl))
+
+    def delete(self, sid):
+        self._client.delete(self.prefix + sid)
+
+    def metrics(self):
+        return {"backend": "redis", "sessions": sum(1 for _ in self._client.scan_iter(self.prefix + "*"))}
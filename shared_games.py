@@ -0,0 +1,118 @@
+"""Per-game state the web worker processes of one host share through a SQLite file.
+
+An eval job runs on the worker that received the move, but the client may
+poll any worker; the job's status and result are recorded here so every
+worker can report them. Each game's current position is recorded too, so a
+worker can stop its background work (eval job, ponder and speculative
+searches, streams) on a game whose next move another worker received.
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shared_eval_jobs (
+    job_id TEXT PRIMARY KEY,
+    game_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS shared_game_positions (
+    game_id TEXT PRIMARY KEY,
+    fen TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS shared_game_positions_updated ON shared_game_positions (updated);
+"""
+
+
+class SharedGameStore:
+    """Eval job statuses and game positions in a SQLite file (one connection per thread).
+
+    Rows not updated for `ttl` seconds are purged periodically.
+    """
+
+    def __init__(self, path, ttl=24 * 3600, purge_interval=300.0):
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._next_purge = 0.0
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        connection.commit()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def record_job(self, job_id, game_id, status, result=None):
+        """Records an eval job's new status, with its result once done."""
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO shared_eval_jobs (job_id, game_id, status, result, updated) "
+                                   "VALUES (?, ?, ?, ?, ?)",
+                                   (job_id, game_id, status, json.dumps(result) if result is not None else None,
+                                    time.time()))
+        except sqlite3.Error as e:
+            logger.info(f"Shared store write of job {job_id} failed: {e}")
+        self._purge()
+
+    def job(self, job_id):
+        """Returns `{"game_id", "status", "result", "updated"}` of a recorded job, or None."""
+        try:
+            row = self._connection().execute("SELECT game_id, status, result, updated FROM shared_eval_jobs "
+                                             "WHERE job_id = ?", (job_id,)).fetchone()
+        except sqlite3.Error as e:
+            logger.info(f"Shared store read of job {job_id} failed: {e}")
+            return None
+        if row is None:
+            return None
+        game_id, status, result, updated = row
+        return {"game_id": game_id, "status": status, "result": json.loads(result) if result else None,
+                "updated": updated}
+
+    def set_position(self, game_id, fen, updated):
+        """Records a game's current position as of time `updated` (an empty `fen` for a game that ended)."""
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute("INSERT OR REPLACE INTO shared_game_positions (game_id, fen, updated) "
+                                   "VALUES (?, ?, ?)", (game_id, fen, updated))
+        except sqlite3.Error as e:
+            logger.info(f"Shared store write of game {game_id} failed: {e}")
+        self._purge()
+
+    def positions_since(self, since):
+        """Returns `[(game_id, fen, updated)]` of the positions recorded at or after time `since`."""
+        try:
+            return self._connection().execute("SELECT game_id, fen, updated FROM shared_game_positions "
+                                              "WHERE updated >= ?", (since,)).fetchall()
+        except sqlite3.Error as e:
+            logger.info(f"Shared store read of game positions failed: {e}")
+            return []
+
+    def _purge(self):
+        now = time.time()
+        if now < self._next_purge:
+            return
+        self._next_purge = now + self.purge_interval
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute("DELETE FROM shared_eval_jobs WHERE updated < ?", (now - self.ttl,))
+                connection.execute("DELETE FROM shared_game_positions WHERE updated < ?", (now - self.ttl,))
+        except sqlite3.Error as e:
+            logger.info(f"Shared store purge failed: {e}")
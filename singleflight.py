@@ -0,0 +1,110 @@
+"""Coalescing of concurrent identical analysis requests into one engine search."""
+import concurrent.futures
+import threading
+
+from analysis_cache import position_key
+from eval_jobs import AnalysisCancelled
+
+# Seconds between checks of a waiting caller's cancel event
+POLL_INTERVAL = 0.05
+
+# Limit fields compared when deciding whether a running search is strong enough
+LIMIT_FIELDS = ("depth", "nodes", "time")
+
+
+def limit_covers(running, wanted):
+    """True if a search with limit `running` searches at least as far as `wanted`.
+
+    A field the running search leaves unset is unbounded; a field only the
+    running search sets could stop it early, so it does not cover `wanted`.
+    """
+    for field in LIMIT_FIELDS:
+        running_value = getattr(running, field)
+        wanted_value = getattr(wanted, field)
+        if running_value is None:
+            continue
+        if wanted_value is None or running_value < wanted_value:
+            return False
+    return True
+
+
+class SingleFlight:
+    """Lets concurrent callers share one in-flight search of the same position.
+
+    A caller whose position is already being searched with at least as many
+    lines and an equal or stronger limit waits on that search's future instead
+    of starting its own. If the search it waits on fails or is cancelled, the
+    caller runs its own search.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.coalesced = 0
+        self.fallbacks = 0
+
+    def run(self, board, multipv, limit, search, cancel_event=None):
+        """Returns `search()` for the position, or the result of a matching search already running."""
+        key = position_key(board)
+        with self._lock:
+            flight = next((flight for flight in self._flights.get(key, ())
+                           if flight["multipv"] >= multipv and limit_covers(flight["limit"], limit)), None)
+            if flight is None:
+                flight = {"multipv": multipv, "limit": limit, "future": concurrent.futures.Future()}
+                self._flights.setdefault(key, []).append(flight)
+                self.searches += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            try:
+                return self._wait(flight["future"], cancel_event)
+            except AnalysisCancelled:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise
+            except Exception:
+                pass
+            # The shared search failed or was cancelled by its own caller
+            with self._lock:
+                self.fallbacks += 1
+            return search()
+
+        try:
+            result = search()
+        except BaseException as e:
+            flight["future"].set_exception(e)
+            raise
+        else:
+            flight["future"].set_result(result)
+            return result
+        finally:
+            with self._lock:
+                flights = self._flights.get(key, [])
+                flights.remove(flight)
+                if not flights:
+                    self._flights.pop(key, None)
+
+    def _wait(self, future, cancel_event):
+        if cancel_event is None:
+            return future.result()
+        while True:
+            if cancel_event.is_set():
+                raise AnalysisCancelled()
+            try:
+                return future.result(timeout=POLL_INTERVAL)
+            except concurrent.futures.TimeoutError:
+                continue
+
+    def metrics(self):
+        with self._lock:
+            requests = self.searches + self.coalesced
+            return {
+                "in_flight": sum(len(flights) for flights in self._flights.values()),
+                "searches": self.searches,
+                "coalesced": self.coalesced,
+                "fallbacks": self.fallbacks,
+                "coalesce_rate": round(self.coalesced / requests, 3) if requests else 0.0,
+            }
@@ -0,0 +1,122 @@
+"""Syzygy endgame tablebase probing for low-material positions."""
+import os
+
+import chess
+import chess.syzygy
+
+
+class Tablebase:
+    """Syzygy tables opened once and shared by all requests.
+
+    python-chess keeps table files memory-mapped (up to `max_fds` at a time) and
+    reuses them across probes, so each probe takes microseconds.
+    """
+
+    def __init__(self, paths, max_pieces=7, max_fds=128):
+        self.paths = [path for path in paths.split(os.pathsep) if path]
+        self._tablebase = chess.syzygy.Tablebase(max_fds=max_fds)
+        for path in self.paths:
+            self._tablebase.add_directory(path)
+        # Largest table actually present (e.g. "KRPvKR" is 5 pieces)
+        largest = max((len(name) - 1 for name in self._tablebase.wdl), default=0)
+        self.max_pieces = min(max_pieces, largest)
+        self.hits = 0
+        self.misses = 0
+
+    def covers(self, board):
+        """True if the position has few enough pieces, no castling rights and its table is present."""
+        return (
+            self.max_pieces > 0
+            and chess.popcount(board.occupied) <= self.max_pieces
+            and not board.castling_rights
+            and self._tablebase.get_wdl(board) is not None
+        )
+
+    def _probe(self, board):
+        """Returns (wdl, dtz) for the side to move, or None if a table is missing."""
+        try:
+            return self._tablebase.probe_wdl(board), self._tablebase.probe_dtz(board)
+        except KeyError:
+            return None
+
+    def _ranked_moves(self, board):
+        """Returns `[(move, wdl, dtz), ...]` from the mover's perspective, best first.
+
+        Wins prefer zeroing moves and the shortest DTZ, losses the longest DTZ.
+        """
+        ranked = []
+        for move in board.legal_moves:
+            zeroing = board.is_zeroing(move)
+            board.push(move)
+            try:
+                if board.is_checkmate():
+                    result = (-2, -1)
+                else:
+                    result = self._probe(board)
+            finally:
+                board.pop()
+            if result is None:
+                return []
+            child_wdl, child_dtz = result
+            ranked.append((move, -child_wdl, -child_dtz, zeroing))
+
+        def key(item):
+            _, wdl, dtz, zeroing = item
+            if wdl > 0:
+                return (wdl, zeroing, -abs(dtz))
+            if wdl < 0:
+                return (wdl, False, abs(dtz))
+            return (0, False, 0)
+
+        ranked.sort(key=key, reverse=True)
+        return [(move, wdl, dtz) for move, wdl, dtz, _ in ranked]
+
+    def probe(self, board, max_lines=3, line_length=4):
+        """Returns the tablebase result and best lines of a position, or None if not covered.
+
+        The result is `{"wdl", "dtz", "lines": [{"pv", "wdl", "dtz"}]}` with
+        WDL/DTZ from the perspective of the side to move; each line's values
+        are for the position after its first move, still from that side's view.
+        """
+        if not self.covers(board) or board.is_game_over():
+            self.misses += 1
+            return None
+
+        result = self._probe(board)
+        ranked = self._ranked_moves(board.copy(stack=False)) if result else []
+        if not ranked:
+            self.misses += 1
+            return None
+        self.hits += 1
+
+        lines = []
+        for move, wdl, dtz in ranked[:max_lines]:
+            pv = [move]
+            temp_board = board.copy(stack=False)
+            temp_board.push(move)
+            while len(pv) < line_length and not temp_board.is_game_over():
+                replies = self._ranked_moves(temp_board)
+                if not replies:
+                    break
+                pv.append(replies[0][0])
+                temp_board.push(replies[0][0])
+            lines.append({"pv": [pv_move.uci() for pv_move in pv], "wdl": wdl, "dtz": dtz})
+
+        wdl, dtz = result
+        return {"wdl": wdl, "dtz": dtz, "lines": lines}
+
+    def close(self):
+        self._tablebase.close()
+
+    def metrics(self):
+        return {"paths": self.paths, "max_pieces": self.max_pieces, "hits": self.hits, "misses": self.misses}
+
+
+def format_tablebase_score(wdl, dtz, turn):
+    """Formats a WDL/DTZ result of the side to move relative to White, like the engine scores."""
+    if wdl == 0:
+        return "Tablebase: Draw"
+    white_wdl = wdl if turn == chess.WHITE else -wdl
+    winner = "White" if white_wdl > 0 else "Black"
+    cursed = " (cursed, 50-move draw)" if abs(wdl) == 1 else ""
+    return f"Tablebase: {winner} wins{cursed}, DTZ {abs(dtz)}"
@@ -0,0 +1,67 @@
+"""Shared fixtures: a fake UCI engine and engine pools built from it, so no Stockfish is needed."""
+import os
+import sys
+
+import chess
+import chess.engine
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine_pool import EnginePool  # noqa: E402
+
+
+class FakeEngine:
+    """Stands in for chess.engine.SimpleEngine: answers searches instantly.
+
+    Lines are the legal moves in UCI order, scored 10cp apart from the side
+    to move's point of view. Depth and nodes echo the limit.
+    """
+
+    def __init__(self):
+        self.searches = []
+        self.pings = 0
+        self.closed = False
+
+    def analyse(self, board, limit, multipv=None, game=None, root_moves=None, **kwargs):
+        self.searches.append({"fen": board.fen(), "limit": limit, "multipv": multipv, "game": game})
+        moves = sorted(root_moves or board.legal_moves, key=lambda move: move.uci())
+        infos = [{
+            "multipv": index + 1,
+            "score": chess.engine.PovScore(chess.engine.Cp(-10 * index), board.turn),
+            "depth": limit.depth or 10,
+            "nodes": limit.nodes or 1000,
+            "pv": [move],
+        } for index, move in enumerate(moves[:multipv or 1])]
+        return infos if multipv is not None else infos[0]
+
+    def configure(self, options):
+        pass
+
+    def ping(self):
+        self.pings += 1
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    """Returns a factory of started EnginePools of FakeEngines, closed after the test."""
+    pools = []
+
+    def make(size=2, spares=0, **kwargs):
+        pool = EnginePool("fake-stockfish", size=size, spares=spares, health_interval=60.0, **kwargs)
+        monkeypatch.setattr(pool, "_spawn", FakeEngine)
+        # Health checks take idle engines aside for a moment; keep checkouts deterministic
+        monkeypatch.setattr(pool, "_supervise", lambda: None)
+        pool.start()
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.close()
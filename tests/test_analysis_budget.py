@@ -0,0 +1,59 @@
+import threading
+import time
+
+import chess
+import pytest
+
+from analysis_budget import DEFAULT_SITE_BUDGETS, MIN_DEPTH, AnalysisBudget
+
+
+@pytest.fixture
+def busy_pool(make_pool):
+    """A one-engine pool with its engine checked out and two requests queued behind it."""
+    pool = make_pool(size=1)
+    release = threading.Event()
+    started = []
+
+    def hold(timeout):
+        with pool.checkout(timeout=timeout):
+            started.append(True)
+            release.wait(5.0)
+
+    holder = threading.Thread(target=hold, args=(1.0,))
+    holder.start()
+    while not started:
+        time.sleep(0.001)
+    waiters = [threading.Thread(target=hold, args=(5.0,)) for _ in range(2)]
+    for waiter in waiters:
+        waiter.start()
+    while pool.load()[2] < 2:
+        time.sleep(0.001)
+    yield pool
+    release.set()
+    for thread in [holder] + waiters:
+        thread.join(timeout=5.0)
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        AnalysisBudget(None, mode="mcts")
+
+
+def test_nodes_mode_ignores_load(make_pool, busy_pool):
+    idle = AnalysisBudget(make_pool(size=2), mode="nodes")
+    loaded = AnalysisBudget(busy_pool, mode="nodes")
+    assert idle.load_shift() > 0 > loaded.load_shift()
+    nodes = DEFAULT_SITE_BUDGETS["eval"]["nodes"]
+    assert idle.limit("eval").nodes == loaded.limit("eval").nodes == nodes
+
+
+def test_depth_mode_adapts_to_load(make_pool, busy_pool):
+    idle = AnalysisBudget(make_pool(size=2)).limit("eval", chess.Board())
+    loaded = AnalysisBudget(busy_pool).limit("eval", chess.Board())
+    assert idle.depth > DEFAULT_SITE_BUDGETS["eval"]["depth"] > loaded.depth >= MIN_DEPTH
+
+
+def test_endgames_get_extra_depth():
+    budget = AnalysisBudget(None)
+    endgame = budget.limit("eval", chess.Board("4k3/8/8/8/8/8/4P3/4K3 w - - 0 1"))
+    assert endgame.depth == DEFAULT_SITE_BUDGETS["eval"]["depth"] + 2
@@ -0,0 +1,98 @@
+import chess
+
+from analysis_cache import AnalysisCache, entry_from_infos, line_score, position_key
+from conftest import FakeEngine
+
+
+def entry(depth, lines=3):
+    return {"depth": depth, "nodes": 1000, "multipv": lines,
+            "lines": [{"cp": -10 * index, "mate": None, "pv": []} for index in range(lines)]}
+
+
+def test_position_key_ignores_move_counters():
+    board = chess.Board("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 12 40")
+    assert position_key(board) == position_key(chess.Board())
+
+
+def test_position_key_ignores_unplayable_en_passant():
+    # After 1.e4 no black pawn can take en passant
+    with_ep = chess.Board("rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1")
+    without_ep = chess.Board("rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1")
+    assert position_key(with_ep) == position_key(without_ep)
+
+
+def test_position_key_distinguishes_side_to_move_and_castling():
+    assert position_key(chess.Board("4k3/8/8/8/8/8/8/4K3 w - - 0 1")) != position_key(chess.Board("4k3/8/8/8/8/8/8/4K3 b - - 0 1"))
+    no_castling = chess.Board("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1")
+    assert position_key(no_castling) != position_key(chess.Board())
+
+
+def test_entry_from_infos_is_white_relative():
+    board = chess.Board()
+    board.push_san("e4")
+    infos = FakeEngine().analyse(board, chess.engine.Limit(depth=12), multipv=2)
+    cached = entry_from_infos(infos)
+    assert cached["depth"] == 12
+    assert cached["multipv"] == 2
+    # Black to move: the second-best line is worse for Black, so better for White
+    assert [line["cp"] for line in cached["lines"]] == [0, 10]
+    assert line_score(cached["lines"][1]) == chess.engine.Cp(10)
+
+
+def test_get_counts_hits_and_misses():
+    cache = AnalysisCache()
+    board = chess.Board()
+    assert cache.get(board) is None
+    cache.put(board, entry(12))
+    assert cache.get(board, multipv=3, min_depth=12) is not None
+    assert cache.peek(board, min_depth=13) is None
+    assert cache.metrics()["hits"] == 1
+    assert cache.metrics()["misses"] == 1
+
+
+def test_get_requires_enough_lines():
+    cache = AnalysisCache()
+    board = chess.Board()
+    cache.put(board, entry(20, lines=1))
+    assert cache.get(board, multipv=1) is not None
+    assert cache.get(board, multipv=3) is None
+
+
+def test_one_line_per_legal_move_satisfies_any_multipv():
+    cache = AnalysisCache()
+    # Black's king has a single legal move
+    board = chess.Board("k7/8/8/8/8/8/8/1R5K b - - 0 1")
+    cache.put(board, entry(12, lines=1))
+    assert cache.get(board, multipv=3) is not None
+
+
+def test_shallower_result_does_not_replace_deeper():
+    cache = AnalysisCache()
+    board = chess.Board()
+    cache.put(board, entry(20))
+    cache.put(board, entry(10))
+    assert cache.get(board)["depth"] == 20
+    # More lines replace fewer, even when shallower
+    cache.put(board, entry(20, lines=1))
+    cache.put(board, entry(15, lines=3))
+    assert cache.get(board, multipv=3)["depth"] == 15
+
+
+def test_empty_results_are_not_cached():
+    cache = AnalysisCache()
+    cache.put(chess.Board(), entry(12, lines=0))
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = AnalysisCache(max_entries=2)
+    first, second, third = chess.Board(), chess.Board(), chess.Board()
+    second.push_san("e4")
+    third.push_san("d4")
+    cache.put(first, entry(10))
+    cache.put(second, entry(10))
+    cache.get(first)
+    cache.put(third, entry(10))
+    assert cache.peek(first) is not None
+    assert cache.peek(second) is None
+    assert cache.metrics()["evictions"] == 1
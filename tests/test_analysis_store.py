@@ -0,0 +1,76 @@
+import chess
+import pytest
+
+from analysis_cache import AnalysisCache
+from analysis_store import AnalysisStore, position_epd
+
+
+def entry(depth, lines=1):
+    return {"depth": depth, "nodes": 1000, "multipv": lines,
+            "lines": [{"cp": 25, "mate": None, "pv": ["e2e4"]}] * lines}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = AnalysisStore(str(tmp_path / "analysis.sqlite3"), flush_interval=0.01)
+    yield store
+    store.close()
+
+
+def test_position_epd_drops_move_counters():
+    board = chess.Board("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 12 40")
+    assert position_epd(board) == position_epd(chess.Board())
+
+
+def test_put_is_readable_after_flush(store):
+    board = chess.Board()
+    store.put(board, entry(14))
+    store.flush()
+    assert store.get(board) == entry(14)
+    assert store.contains(position_epd(board))
+    assert store.get(chess.Board("4k3/8/8/8/8/8/8/4K3 w - - 0 1")) is None
+    assert len(store) == 1
+
+
+def test_shallower_write_keeps_the_deeper_row(store):
+    board = chess.Board()
+    store.put(board, entry(20))
+    store.put(board, entry(12))
+    store.flush()
+    assert store.get(board)["depth"] == 20
+    store.put(board, entry(12, lines=3))
+    store.flush()
+    assert store.get(board)["multipv"] == 3
+
+
+def test_tables_are_independent(store):
+    heatmaps = AnalysisStore(store.path, table="heatmap", flush_interval=0.01)
+    try:
+        heatmaps.put(chess.Board(), entry(8, lines=20))
+        heatmaps.flush()
+        assert store.get(chess.Board()) is None
+        assert heatmaps.get(chess.Board())["multipv"] == 20
+    finally:
+        heatmaps.close()
+
+
+def test_entries_survive_reopening(store):
+    store.put(chess.Board(), entry(16))
+    store.close()
+    reopened = AnalysisStore(store.path)
+    try:
+        assert reopened.get(chess.Board())["depth"] == 16
+    finally:
+        reopened.close()
+
+
+def test_cache_falls_through_to_store_and_writes_through(store):
+    board = chess.Board()
+    AnalysisCache(store=store).put(board, entry(18))
+    store.flush()
+
+    # A fresh cache, e.g. in another worker process, finds the entry on disk
+    cache = AnalysisCache(store=store)
+    assert cache.get(board, min_depth=18)["depth"] == 18
+    assert len(cache) == 1
+    assert cache.get(board, min_depth=19) is None
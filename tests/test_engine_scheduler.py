@@ -0,0 +1,147 @@
+import threading
+import time
+
+import pytest
+
+from engine_pool import EnginePoolTimeout
+from engine_scheduler import EngineScheduler, Histogram, parse_class_caps, priority_class
+
+
+def serve(scheduler):
+    """Grants the next ticket and returns it (None if nothing can be served)."""
+    ticket = scheduler.next_ticket()
+    if ticket is not None:
+        scheduler.grant(ticket, waited=0.0)
+    return ticket
+
+
+def test_call_sites_map_to_classes():
+    assert priority_class("eval") == "interactive"
+    assert priority_class("review") == "batch"
+    assert priority_class("unknown") == "interactive"
+
+
+def test_parse_class_caps():
+    assert parse_class_caps("batch=2, speculative=1,") == {"batch": 2, "speculative": 1}
+    assert parse_class_caps("") == {}
+    with pytest.raises(ValueError):
+        parse_class_caps("urgent=1")
+
+
+def test_classes_are_served_in_priority_order():
+    scheduler = EngineScheduler()
+    batch = scheduler.enqueue("batch", "a")
+    speculative = scheduler.enqueue("speculative", "a")
+    interactive = scheduler.enqueue("interactive", "b")
+    assert [serve(scheduler) for _ in range(3)] == [interactive, speculative, batch]
+    assert serve(scheduler) is None
+
+
+def test_tenants_take_turns_within_a_class():
+    scheduler = EngineScheduler()
+    a1, a2, a3 = (scheduler.enqueue("batch", "a") for _ in range(3))
+    b1 = scheduler.enqueue("batch", "b")
+    assert [serve(scheduler) for _ in range(4)] == [a1, b1, a2, a3]
+
+
+def test_capped_class_is_skipped_until_a_search_finishes():
+    scheduler = EngineScheduler(class_caps={"batch": 1})
+    first = scheduler.enqueue("batch", "a")
+    second = scheduler.enqueue("batch", "b")
+    assert serve(scheduler) == first
+    assert serve(scheduler) is None
+    scheduler.finish("batch", 0.2)
+    assert serve(scheduler) == second
+
+
+def test_removed_ticket_is_never_served():
+    scheduler = EngineScheduler()
+    gave_up = scheduler.enqueue("tutor", "a")
+    waiting = scheduler.enqueue("tutor", "a")
+    scheduler.remove(gave_up)
+    assert serve(scheduler) == waiting
+    assert scheduler.metrics()["tutor"]["waiting"] == 0
+
+
+def test_metrics_count_running_and_served():
+    scheduler = EngineScheduler()
+    scheduler.start("speculative")
+    scheduler.grant(scheduler.enqueue("interactive", "a"), waited=0.003)
+    scheduler.finish("interactive", 0.04)
+    metrics = scheduler.metrics()
+    assert metrics["speculative"]["running"] == 1
+    assert metrics["interactive"]["running"] == 0
+    assert metrics["interactive"]["served"] == 1
+    assert metrics["interactive"]["queue_time"]["buckets"]["<=5"] == 1
+    assert metrics["interactive"]["service_time"]["buckets"]["<=50"] == 1
+
+
+def test_histogram_buckets():
+    histogram = Histogram()
+    for seconds in (0.0005, 0.001, 0.002, 60.0):
+        histogram.record(seconds)
+    metrics = histogram.metrics()
+    assert metrics["count"] == 4
+    assert metrics["buckets"]["<=1"] == 2
+    assert metrics["buckets"]["<=5"] == 1
+    assert metrics["buckets"][">10000"] == 1
+    assert metrics["max_ms"] == 60000.0
+
+
+# --- Engine pool scheduling, with fake engines ---
+def test_waiting_interactive_checkout_goes_before_batch(make_pool):
+    pool = make_pool(size=1)
+    order = []
+
+    def wait_for_engine(priority):
+        with pool.checkout(timeout=5.0, priority=priority, tenant=priority):
+            order.append(priority)
+
+    with pool.checkout(priority="interactive"):
+        waiters = [threading.Thread(target=wait_for_engine, args=("batch",))]
+        waiters[0].start()
+        while pool.load()[2] < 1:
+            time.sleep(0.001)
+        waiters.append(threading.Thread(target=wait_for_engine, args=("interactive",)))
+        waiters[1].start()
+        while pool.load()[2] < 2:
+            time.sleep(0.001)
+    for waiter in waiters:
+        waiter.join(timeout=5.0)
+    assert order == ["interactive", "batch"]
+
+
+def test_class_cap_holds_back_batch_checkouts(make_pool):
+    pool = make_pool(size=2, class_caps={"batch": 1})
+    with pool.checkout(priority="batch"):
+        with pytest.raises(EnginePoolTimeout):
+            with pool.checkout(timeout=0.05, priority="batch"):
+                pass
+        with pool.checkout(timeout=0.05, priority="interactive") as engine:
+            assert engine is not None
+    assert pool.metrics()["timeouts"] == 1
+
+
+def test_try_checkout_yields_none_without_an_idle_engine(make_pool):
+    pool = make_pool(size=1)
+    with pool.checkout():
+        with pool.try_checkout() as engine:
+            assert engine is None
+    with pool.try_checkout() as engine:
+        assert engine is not None
+    assert pool.metrics()["classes"]["speculative"]["served"] == 1
+
+
+def test_game_sticks_to_one_engine_and_falls_back_while_it_is_busy(make_pool):
+    pool = make_pool(size=2)
+    with pool.checkout(affinity="game-1") as first:
+        pass
+    with pool.checkout() as other:
+        assert other is first
+        with pool.checkout(affinity="game-1") as fallback:
+            assert fallback is not first
+    with pool.checkout(affinity="game-1") as again:
+        assert again is first
+    affinity = pool.metrics()["affinity"]
+    assert affinity["sticky"]["searches"] == 1
+    assert affinity["fallback"]["searches"] == 1
@@ -0,0 +1,103 @@
+import socket
+import threading
+
+import chess
+import chess.engine
+import pytest
+
+from engine_worker import EngineWorker, RemoteEngines, WorkerUnavailable, _RequestHandler, _TCPServer, limit_to_json, parse_address
+
+
+@pytest.fixture
+def start_worker(make_pool):
+    """Returns a factory of engine workers on localhost serving pools of fake engines."""
+    servers = []
+
+    def start(size=2):
+        server = _TCPServer(("127.0.0.1", 0), _RequestHandler)
+        server.worker = EngineWorker(make_pool(size=size))
+        threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True).start()
+        servers.append(server)
+        return f"tcp://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def unused_address():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"tcp://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def test_parse_address():
+    assert parse_address("tcp://10.0.0.2:7001") == (socket.AF_INET, ("10.0.0.2", 7001))
+    assert parse_address(":7001") == (socket.AF_INET, ("127.0.0.1", 7001))
+    assert parse_address("unix:///tmp/worker.sock") == (socket.AF_UNIX, "/tmp/worker.sock")
+
+
+def test_limit_to_json_keeps_set_fields():
+    assert limit_to_json(chess.engine.Limit(depth=16, time=0.3)) == {"depth": 16, "time": 0.3}
+
+
+def test_worker_handles_requests(make_pool):
+    worker = EngineWorker(make_pool(size=1))
+    assert worker.handle({"op": "ping"})["ok"]
+    response = worker.handle({"op": "analyse", "fen": chess.STARTING_FEN, "multipv": 3, "limit": {"depth": 12}})
+    assert response["ok"]
+    assert response["entry"]["depth"] == 12
+    assert response["entry"]["multipv"] == 3
+    assert not worker.handle({"op": "shutdown"})["ok"]
+    assert not worker.handle({"op": "analyse", "fen": "not a fen", "limit": {}})["ok"]
+
+
+def test_remote_search_returns_a_cache_entry(start_worker):
+    remote = RemoteEngines([start_worker()])
+    try:
+        assert remote.start() == 1
+        entry = remote.analyse(chess.Board(), chess.engine.Limit(depth=14), multipv=2, affinity="game-1")
+        assert entry["depth"] == 14
+        assert len(entry["lines"]) == 2
+        assert remote.metrics()["workers"][0]["size"] == 2
+    finally:
+        remote.close()
+
+
+def test_search_fails_over_from_a_dead_worker(start_worker):
+    dead, live = unused_address(), start_worker()
+    remote = RemoteEngines([dead, live])
+    try:
+        remote.start()
+        # Pretend the dead worker passed its last heartbeat
+        remote._workers[0]["up"] = True
+        entry = remote.analyse(chess.Board(), chess.engine.Limit(depth=10), affinity="game-1")
+        assert entry["depth"] == 10
+        workers = remote.metrics()["workers"]
+        assert not workers[0]["up"]
+        assert workers[1]["searches"] >= 1
+    finally:
+        remote.close()
+
+
+def test_no_live_worker_raises():
+    remote = RemoteEngines([unused_address()])
+    try:
+        assert remote.start() == 0
+        assert not remote.available
+        with pytest.raises(WorkerUnavailable):
+            remote.analyse(chess.Board(), chess.engine.Limit(depth=10))
+    finally:
+        remote.close()
+
+
+def test_game_sticks_to_its_worker(start_worker):
+    remote = RemoteEngines([start_worker(), start_worker()])
+    try:
+        remote.start()
+        for _ in range(3):
+            remote.analyse(chess.Board(), chess.engine.Limit(depth=10), affinity="game-1")
+        assert sorted(worker["searches"] for worker in remote.metrics()["workers"]) == [0, 3]
+    finally:
+        remote.close()
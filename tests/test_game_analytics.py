@@ -0,0 +1,50 @@
+import numpy as np
+
+from game_analytics import MATE_SCORE, analyse_game, analyse_games, eval_matrix, win_probability
+
+
+def test_eval_matrix_pads_and_clamps():
+    evals = eval_matrix([[0, 20000], [None]])
+    assert evals.shape == (2, 2)
+    assert evals[0, 1] == MATE_SCORE
+    assert np.isnan(evals[1]).all()
+
+
+def test_win_probability_is_even_at_zero():
+    assert win_probability(np.array([0.0]))[0] == 50.0
+
+
+def test_centipawn_loss_per_side():
+    result = analyse_game([20, 30, -250, -240])
+    # Every move keeps or improves its mover's eval
+    assert result["centipawn_loss"] == [0, 0, 0]
+    blunder = analyse_game([20, -300, -300])
+    assert blunder["centipawn_loss"] == [320, 0]
+    assert blunder["white"]["average_loss"] == 320
+    assert blunder["black"]["average_loss"] == 0
+    assert blunder["swings"] == [0]
+
+
+def test_black_first_flips_the_mover():
+    result = analyse_games([[20, -300]], white_first=[False])[0]
+    assert result["centipawn_loss"] == [0]
+    assert result["black"]["average_loss"] == 0
+    assert result["white"]["average_loss"] is None
+
+
+def test_empty_and_single_position_games_in_a_batch():
+    results = analyse_games([[0, 30, -20], [], [15]])
+    assert len(results[0]["centipawn_loss"]) == 2
+    for result in results[1:]:
+        assert result["centipawn_loss"] == []
+        assert result["accuracy"] == []
+        assert result["swings"] == []
+        assert result["critical_moments"] == []
+        assert result["white"]["average_loss"] is None
+    assert results[1]["evals"] == []
+    assert results[2]["evals"] == [15]
+
+
+def test_batch_results_match_single_games():
+    games = [[0, 30, -20, 400], [10, -500], [35, 20, 25]]
+    assert analyse_games(games) == [analyse_game(evals) for evals in games]
@@ -0,0 +1,73 @@
+import random
+
+import chess
+import pytest
+
+from game_codec import decode_moves, encode_moves, from_pgn, from_text, pack_move, to_pgn, to_text, unpack_move
+
+
+def random_game(seed, plies=200):
+    rng = random.Random(seed)
+    board = chess.Board()
+    while len(board.move_stack) < plies and not board.is_game_over():
+        board.push(rng.choice(sorted(board.legal_moves, key=pack_move)))
+    return board
+
+
+@pytest.mark.parametrize("uci", ["e2e4", "e1g1", "e5d6", "a7a8q", "b2b1n", "h7g8r", "c7c8b"])
+def test_pack_round_trip(uci):
+    move = chess.Move.from_uci(uci)
+    assert 0 <= pack_move(move) < 1 << 16
+    assert unpack_move(pack_move(move)) == move
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_games_round_trip(seed):
+    board = random_game(seed)
+    data = encode_moves(board.move_stack)
+    assert len(data) == 2 * len(board.move_stack)
+    assert decode_moves(data) == board.move_stack
+    assert decode_moves(from_text(to_text(data))) == board.move_stack
+
+
+def test_empty_game():
+    assert encode_moves([]) == b""
+    assert decode_moves(b"") == []
+    assert from_text(to_text(b"")) == b""
+
+
+def test_text_form_is_ascii():
+    text = to_text(encode_moves(random_game(0).move_stack))
+    assert text.isascii()
+
+
+def test_from_pgn_reads_the_fen_header():
+    parsed = from_pgn('[FEN "4k3/P7/8/8/8/8/8/4K3 w - - 0 1"]\n[SetUp "1"]\n\n1. a8=Q+ Kd7 *')
+    assert parsed is not None
+    board, moves = parsed
+    assert board.fen() == "4k3/P7/8/8/8/8/8/4K3 w - - 0 1"
+    assert [move.uci() for move in moves] == ["a7a8q", "e8d7"]
+
+
+def test_from_pgn_rejects_illegal_moves():
+    assert from_pgn("1. e4 e5 2. Ke3 *") is None
+
+
+def test_pgn_round_trip_from_a_custom_position():
+    board = chess.Board("4k3/P7/8/8/8/8/8/4K3 w - - 0 1")
+    board.push_uci("a7a8q")
+    board.push_uci("e8d7")
+    pgn = to_pgn(board, headers={"Event": "Lesson"})
+    assert '[Event "Lesson"]' in pgn
+    assert "1. a8=Q+ Kd7" in pgn
+    start, moves = from_pgn(pgn)
+    assert start.fen() == board.root().fen()
+    assert moves == board.move_stack
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_random_games_round_trip_through_pgn(seed):
+    board = random_game(seed)
+    start, moves = from_pgn(to_pgn(board))
+    assert start == chess.Board()
+    assert moves == board.move_stack
@@ -0,0 +1,99 @@
+import chess
+
+from game_state import GameState
+
+KNIGHT_SHUFFLE = ["g1f3", "g8f6", "f3g1", "f6g8"]
+
+
+def play(game, ucis):
+    for uci in ucis:
+        game.push(chess.Move.from_uci(uci))
+
+
+def test_repetitions_count_the_start_position():
+    game = GameState()
+    assert game.repetitions() == 1
+    play(game, KNIGHT_SHUFFLE)
+    assert game.repetitions() == 2
+    assert not game.can_claim_threefold_repetition()
+    play(game, KNIGHT_SHUFFLE)
+    assert game.can_claim_threefold_repetition()
+    assert game.claimable_draws() == ["threefold repetition"]
+    assert not game.is_game_over()
+
+
+def test_fivefold_repetition_ends_the_game():
+    game = GameState()
+    play(game, KNIGHT_SHUFFLE * 4)
+    assert game.termination() == "fivefold_repetition"
+    assert game.board.is_fivefold_repetition()
+
+
+def test_pop_keeps_counts_in_step():
+    game = GameState()
+    play(game, KNIGHT_SHUFFLE * 2)
+    game.pop()
+    assert game.repetitions() == 2
+    play(game, KNIGHT_SHUFFLE[-1:])
+    assert game.repetitions() == 3
+
+
+def test_counts_agree_with_python_chess_along_a_game():
+    game = GameState()
+    for uci in KNIGHT_SHUFFLE * 2 + ["e2e4", "e7e5"] + KNIGHT_SHUFFLE * 2:
+        play(game, [uci])
+        assert game.can_claim_threefold_repetition() == game.board.is_repetition(3)
+
+
+def test_existing_move_stack_is_counted():
+    board = chess.Board()
+    for uci in KNIGHT_SHUFFLE * 2:
+        board.push_uci(uci)
+    game = GameState(board)
+    assert game.repetitions() == 3
+    assert game.start_fen == chess.STARTING_FEN
+    # The board passed in is copied
+    board.pop()
+    assert len(game.board.move_stack) == 8
+
+
+def test_start_fen_of_a_custom_position():
+    fen = "4k3/8/8/8/8/8/4P3/4K3 w - - 0 1"
+    assert GameState(chess.Board(fen)).start_fen == fen
+
+
+def test_move_rules_follow_the_halfmove_clock():
+    game = GameState(chess.Board("4k3/8/8/8/8/8/8/R3K3 w - - 99 80"))
+    assert not game.can_claim_fifty_moves()
+    play(game, ["a1a2"])
+    assert game.claimable_draws() == ["50-move rule"]
+    assert game.termination() is None
+
+    game = GameState(chess.Board("4k3/8/8/8/8/8/8/R3K3 w - - 149 100"))
+    play(game, ["a1a2"])
+    assert game.termination() == "seventyfive_moves"
+
+
+def test_terminations():
+    game = GameState()
+    play(game, ["f2f3", "e7e5", "g2g4", "d8h4"])
+    assert game.termination() == "checkmate"
+    assert GameState(chess.Board("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1")).termination() == "stalemate"
+    assert GameState(chess.Board("8/8/8/8/8/8/k7/2K5 w - - 0 1")).termination() == "insufficient_material"
+
+
+def test_checkmate_takes_precedence_over_the_75_move_rule():
+    game = GameState(chess.Board("7k/8/6K1/8/8/8/8/R7 w - - 149 100"))
+    play(game, ["a1a8"])
+    assert game.termination() == "checkmate"
+
+
+def test_sans_follow_push_and_pop():
+    game = GameState(chess.Board("4k3/P7/8/8/8/8/8/4K3 w - - 0 1"))
+    assert game.push(chess.Move.from_uci("a7a8q")) == "a8=Q+"
+    play(game, ["e8e7", "e1d2"])
+    assert game.sans == ["a8=Q+", "Ke7", "Kd2"]
+    game.pop()
+    assert game.sans == ["a8=Q+", "Ke7"]
+    # Moves already on the board's stack are named once, from its start position
+    assert GameState(game.board).sans == ["a8=Q+", "Ke7"]
@@ -0,0 +1,86 @@
+import chess
+
+from game_codec import encode_moves
+from live_games import LiveGames, rehydrate
+
+ITALIAN_FEN = "r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R b KQkq - 3 3"
+
+
+def moves(*ucis):
+    return encode_moves(chess.Move.from_uci(uci) for uci in ucis)
+
+
+def test_rehydrate_rebuilds_the_move_stack():
+    game = rehydrate(moves("e2e4", "e7e5", "g1f3", "b8c6", "f1c4"))
+    assert game.board.fen() == ITALIAN_FEN
+    assert len(game.board.move_stack) == 5
+
+
+def test_rehydrate_from_a_start_position():
+    start_fen = "4k3/8/8/8/8/8/4P3/4K3 w - - 0 1"
+    game = rehydrate(moves("e2e4"), start_fen)
+    assert game.start_fen == start_fen
+    assert game.board.root().fen() == start_fen
+
+
+def test_board_is_kept_between_requests():
+    live_games = LiveGames()
+    data = moves("e2e4", "e7e5")
+    with live_games.game("g", data) as game:
+        game.push(chess.Move.from_uci("g1f3"))
+    # The session now records the pushed move too
+    board = live_games.snapshot("g", data + moves("g1f3"))
+    assert board.move_stack[-1] == chess.Move.from_uci("g1f3")
+    assert live_games.metrics()["rehydrations"] == 1
+    assert live_games.metrics()["hits"] == 1
+
+
+def test_games_ending_with_the_same_move_do_not_share_a_board():
+    live_games = LiveGames()
+    e4 = live_games.snapshot("g", moves("e2e4", "e7e5", "g1f3"))
+    d4 = live_games.snapshot("g", moves("d2d4", "e7e5", "g1f3"))
+    assert e4.piece_at(chess.E4) == chess.Piece(chess.PAWN, chess.WHITE)
+    assert d4.piece_at(chess.D4) == chess.Piece(chess.PAWN, chess.WHITE)
+    assert d4.piece_at(chess.E4) is None
+
+
+def test_board_is_rebuilt_when_the_start_position_differs():
+    live_games = LiveGames()
+    live_games.snapshot("g", b"")
+    board = live_games.snapshot("g", b"", "4k3/8/8/8/8/8/8/4K3 w - - 0 1")
+    assert board.fen() == "4k3/8/8/8/8/8/8/4K3 w - - 0 1"
+
+
+def test_undo_pops_the_live_board():
+    live_games = LiveGames()
+    data = moves("e2e4", "e7e5")
+    with live_games.game("g", data) as game:
+        game.pop()
+    assert live_games.snapshot("g", data[:-2]).fen() == "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"
+    assert live_games.metrics()["rehydrations"] == 1
+
+
+def test_snapshot_is_a_copy():
+    live_games = LiveGames()
+    board = live_games.snapshot("g", moves("e2e4"))
+    board.push_san("e5")
+    assert len(live_games.snapshot("g", moves("e2e4")).move_stack) == 1
+
+
+def test_reset_replaces_the_game():
+    live_games = LiveGames()
+    live_games.snapshot("g", moves("e2e4"))
+    start = chess.Board("4k3/8/8/8/8/8/8/4K3 w - - 0 1")
+    live_games.reset("g", start)
+    assert live_games.snapshot("g", b"", start.fen()).fen() == start.fen()
+    assert live_games.metrics()["hits"] == 1
+
+
+def test_least_recently_used_games_are_evicted():
+    live_games = LiveGames(max_games=2)
+    for game_id in ("a", "b", "a", "c"):
+        live_games.snapshot(game_id, b"")
+    assert len(live_games) == 2
+    assert live_games.metrics()["evictions"] == 1
+    live_games.snapshot("b", b"")
+    assert live_games.metrics()["rehydrations"] == 4
@@ -0,0 +1,33 @@
+import chess
+
+from analysis_budget import AnalysisBudget
+from move_heatmap import MoveHeatmap, score_losses
+
+
+def test_every_legal_move_is_scored_across_the_pool(make_pool):
+    pool = make_pool(size=3)
+    heatmap = MoveHeatmap(pool, AnalysisBudget(pool))
+    try:
+        board = chess.Board()
+        entry = heatmap.entry(board)
+        assert sorted(line["pv"][0] for line in entry["lines"]) == sorted(move.uci() for move in board.legal_moves)
+        assert pool.metrics()["checkouts"] == 3
+        # Cached per position
+        assert heatmap.entry(board) is entry
+        assert pool.metrics()["checkouts"] == 3
+    finally:
+        heatmap.shutdown()
+
+
+def test_losses_are_positive_for_either_side():
+    entry = {"lines": [{"cp": 50, "mate": None, "pv": ["a"]}, {"cp": -30, "mate": None, "pv": ["b"]}]}
+    assert score_losses(chess.Board(), entry) == {"a": 0, "b": 80}
+    black_to_move = chess.Board("4k3/8/8/8/8/8/8/4K3 b - - 0 1")
+    assert score_losses(black_to_move, entry) == {"a": 80, "b": 0}
+
+
+def test_mate_counts_as_a_large_loss():
+    entry = {"lines": [{"cp": None, "mate": 2, "pv": ["a"]}, {"cp": 0, "mate": None, "pv": ["b"]}]}
+    losses = score_losses(chess.Board(), entry)
+    assert losses["a"] == 0
+    assert losses["b"] > 9000
@@ -0,0 +1,35 @@
+import chess
+
+from analysis_budget import AnalysisBudget
+from analysis_cache import AnalysisCache
+from prefetch import Prefetcher
+
+
+def make_prefetcher(pool):
+    cache = AnalysisCache()
+    board = chess.Board()
+    with pool.checkout() as engine:
+        infos = engine.analyse(board, chess.engine.Limit(depth=10), multipv=3)
+    cache.put(board, {"depth": 10, "nodes": 1000, "multipv": 3,
+                      "lines": [{"cp": 0, "mate": None, "pv": [info["pv"][0].uci()]} for info in infos]})
+    return Prefetcher(pool, cache, AnalysisBudget(pool)), cache, board
+
+
+def test_schedule_without_a_worker_queues_nothing(make_pool):
+    prefetcher, _, board = make_prefetcher(make_pool(size=1))
+    prefetcher.schedule("game", board)
+    assert prefetcher.metrics()["pending"] == 0
+    assert prefetcher.metrics()["scheduled"] == 0
+
+
+def test_schedule_queues_the_replies_while_the_worker_runs(make_pool):
+    prefetcher, _, board = make_prefetcher(make_pool(size=1))
+    prefetcher.start()
+    try:
+        prefetcher.schedule("game", board)
+        # The three replies of the cached lines
+        assert prefetcher.metrics()["scheduled"] == 3
+    finally:
+        prefetcher.stop()
+    prefetcher.schedule("game", board)
+    assert prefetcher.metrics()["scheduled"] == 3
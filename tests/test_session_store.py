@@ -0,0 +1,137 @@
+import json
+
+import flask
+import pytest
+
+import session_store
+from session_store import (COMPRESSED, PLAIN, MemorySessionStore, ServerSessionInterface, SqliteSessionStore,
+                           dumps, loads)
+
+
+class Clock:
+    """Replaces time.time() in session_store so expiry can be tested without sleeping."""
+
+    def __init__(self, monkeypatch):
+        self.now = 1000.0
+        monkeypatch.setattr(session_store.time, "time", lambda: self.now)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    return Clock(monkeypatch)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemorySessionStore()
+    return SqliteSessionStore(str(tmp_path / "sessions.sqlite3"))
+
+
+def test_small_payloads_are_stored_plain():
+    blob = dumps({"board_fen": "8/8/8/8/8/8/8/K6k w - - 0 1"})
+    assert blob[:1] == PLAIN
+    assert loads(blob) == {"board_fen": "8/8/8/8/8/8/8/K6k w - - 0 1"}
+
+
+def test_large_payloads_are_compressed():
+    data = {"chat_history": [{"role": "assistant", "content": "Develop your knights before your bishops. " * 20}] * 5}
+    blob = dumps(data)
+    assert blob[:1] == COMPRESSED
+    # The repeated reply is stored once
+    assert len(blob) < len(json.dumps(data)) // 10
+    assert loads(blob) == data
+
+
+def test_save_load_delete(store):
+    store.save("sid", dumps({"a": 1}), ttl=60)
+    assert loads(store.load("sid")) == {"a": 1}
+    store.save("sid", dumps({"a": 2}), ttl=60)
+    assert loads(store.load("sid")) == {"a": 2}
+    store.delete("sid")
+    assert store.load("sid") is None
+    assert store.load("unknown") is None
+
+
+def test_sessions_expire_unless_touched(store, clock):
+    store.save("kept", dumps({}), ttl=60)
+    store.save("dropped", dumps({}), ttl=60)
+    clock.now += 50
+    store.touch("kept", ttl=60)
+    clock.now += 50
+    assert store.load("kept") is not None
+    assert store.load("dropped") is None
+
+
+def test_memory_store_evicts_least_recently_used():
+    store = MemorySessionStore(max_entries=2)
+    store.save("a", dumps({}), ttl=60)
+    store.save("b", dumps({}), ttl=60)
+    store.load("a")
+    store.save("c", dumps({}), ttl=60)
+    assert store.load("a") is not None
+    assert store.load("b") is None
+    assert store.metrics()["evictions"] == 1
+
+
+def test_sqlite_store_purges_expired_rows(tmp_path, clock):
+    store = SqliteSessionStore(str(tmp_path / "sessions.sqlite3"), purge_interval=10.0)
+    store.save("old", dumps({}), ttl=5)
+    clock.now += 20
+    store.save("new", dumps({}), ttl=5)
+    assert store.metrics()["sessions"] == 1
+    assert store.metrics()["expired"] == 1
+
+
+@pytest.fixture
+def app(store):
+    app = flask.Flask(__name__)
+    app.session_interface = ServerSessionInterface(store, ttl=60)
+
+    @app.route("/set/<value>")
+    def set_value(value):
+        flask.session["value"] = value
+        return "ok"
+
+    @app.route("/get")
+    def get_value():
+        return flask.session.get("value", "missing")
+
+    @app.route("/clear")
+    def clear():
+        flask.session.clear()
+        return "ok"
+
+    return app
+
+
+def test_cookie_only_carries_the_session_id(app, store):
+    client = app.test_client()
+    client.get("/set/e2e4")
+    cookie = client.get_cookie("session")
+    assert "e2e4" not in cookie.value
+    assert loads(store.load(cookie.value)) == {"value": "e2e4"}
+    assert client.get("/get").text == "e2e4"
+
+
+def test_sessions_are_separate_per_client(app):
+    first, second = app.test_client(), app.test_client()
+    first.get("/set/d2d4")
+    assert second.get("/get").text == "missing"
+
+
+def test_cleared_session_is_deleted(app, store):
+    client = app.test_client()
+    client.get("/set/e2e4")
+    sid = client.get_cookie("session").value
+    client.get("/clear")
+    assert store.load(sid) is None
+    assert client.get_cookie("session") is None
+
+
+def test_unreadable_session_starts_over(app, store):
+    client = app.test_client()
+    client.get("/set/e2e4")
+    sid = client.get_cookie("session").value
+    store.save(sid, b"zcorrupt", ttl=60)
+    assert client.get("/get").text == "missing"
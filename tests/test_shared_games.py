@@ -0,0 +1,67 @@
+import pytest
+
+from eval_jobs import AnalysisCancelled, EvalJobQueue
+from shared_games import SharedGameStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SharedGameStore(str(tmp_path / "shared.sqlite3"))
+
+
+def test_unknown_job(store):
+    assert store.job("missing") is None
+
+
+def test_job_status_and_result_round_trip(store):
+    store.record_job("job", "game", "running")
+    assert store.job("job")["status"] == "running"
+    store.record_job("job", "game", "done", {"fen": "8/8/8/8/8/8/8/K6k w - - 0 1", "top_moves": []})
+    job = store.job("job")
+    assert job["game_id"] == "game"
+    assert job["status"] == "done"
+    assert job["result"]["fen"] == "8/8/8/8/8/8/8/K6k w - - 0 1"
+
+
+def test_other_processes_see_the_jobs(store):
+    store.record_job("job", "game", "failed")
+    assert SharedGameStore(store.path).job("job")["status"] == "failed"
+
+
+@pytest.mark.parametrize("body, status", [
+    (lambda cancel_event: {"fen": "start"}, "done"),
+    (lambda cancel_event: 1 / 0, "failed"),
+    (lambda cancel_event: (_ for _ in ()).throw(AnalysisCancelled()), "cancelled"),
+])
+def test_eval_jobs_publish_their_final_status(store, body, status):
+    jobs = EvalJobQueue(max_workers=1, on_status=store.record_job)
+    try:
+        job_id = jobs.submit("game", body)
+        assert jobs.get(job_id, wait=5.0)["status"] == status
+        assert store.job(job_id)["status"] == status
+        assert store.job(job_id)["result"] == ({"fen": "start"} if status == "done" else None)
+    finally:
+        jobs.shutdown()
+
+
+def test_a_replaced_pending_job_is_published_as_cancelled(store):
+    jobs = EvalJobQueue(max_workers=1, on_status=store.record_job)
+    try:
+        blocker = jobs.submit("other", lambda cancel_event: cancel_event.wait(5.0))
+        first = jobs.submit("game", lambda cancel_event: None)
+        assert store.job(first)["status"] == "pending"
+        jobs.submit("game", lambda cancel_event: None)
+        assert store.job(first)["status"] == "cancelled"
+        jobs.cancel_game("other")
+        jobs.get(blocker, wait=5.0)
+    finally:
+        jobs.shutdown()
+
+
+def test_positions_since(store):
+    store.set_position("old", "fen-1", 100.0)
+    store.set_position("game", "fen-1", 200.0)
+    store.set_position("game", "fen-2", 300.0)
+    assert store.positions_since(150.0) == [("game", "fen-2", 300.0)]
+    store.set_position("old", "", 400.0)
+    assert sorted(store.positions_since(300.0)) == [("game", "fen-2", 300.0), ("old", "", 400.0)]